@@ -1,26 +1,61 @@
 import re
+import sys
 import json
 import logging
+import os
+import zlib
+import hashlib
 import random
+import asyncio
+import itertools
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
 import venusian
 from collections import namedtuple
 from collections import OrderedDict
 from zope.interface import providedBy, Interface
 from pyramid.compat import string_types
 from pyramid.config.views import DefaultViewMapper
+from pyramid.exceptions import ConfigurationError
 from pyramid.location import lineage
+from pyramid.path import AssetResolver
 from pyramid.registry import Introspectable
 from pyramid.renderers import RendererHelper
+from pyramid.threadlocal import manager
 from pyramid.interfaces import IRequest, IRouteRequest
 from pyramid.tweens import EXCVIEW
 
+from djed.layout.cache import LRUCache
+from djed.layout.cache import TieredCache
+from djed.layout.cache import memory_cache_factory
+from djed.layout.data import lazy_data  # noqa
+from djed.layout.data import install_providers
+from djed.layout.data import add_layout_data_provider
+from djed.layout import tags
+from djed.layout.slot import SLOT_PREFIX
+from djed.layout.slot import slot_renderer
+from djed.layout.minify import minify_stage
+
 
 log = logging.getLogger('djed.layout')
 
 LAYOUT_ID = 'djed:layout'
 
+# actions order, run after all layouts are registered
+LAYOUT_POST_CONFIG = 10
+
+# placeholder for content, used for splitting layout output
+CONTENT_MARKER = '<!--djed.layout:content-->'
+
+HTML_RE = re.compile(r'<html\b[^>]*>')
+
+# cached marker for layouts which output can not be split,
+# survives pickling by shared caches
+NOT_SPLITTABLE = False
+
 LayoutInfo = namedtuple(
-    'LayoutInfo', 'name layout view original renderer intr')
+    'LayoutInfo',
+    'name layout view original renderer intr discriminator cacheable vary')
 
 CodeInfo = namedtuple(
     'Codeinfo', 'filename lineno function source module')
@@ -39,13 +74,16 @@ def query_layout(root, context, request, name=''):
     except AttributeError:
         iface = IRequest
 
+    plan = getattr(request.registry, '_djed_layout_plan', None)
+    if plan is not None and name not in plan.names:
+        return None, None
+
     root = providedBy(root)
 
-    adapters = request.registry.adapters
+    index = layout_index(request.registry)
 
     for context in lineage(context):
-        layout_factory = adapters.lookup(
-            (root, iface, providedBy(context)), ILayout, name=name)
+        layout_factory = index.lookup(name, root, iface, providedBy(context))
 
         if layout_factory is not None:
             return layout_factory, context
@@ -53,7 +91,432 @@ def query_layout(root, context, request, name=''):
     return None, None
 
 
+class LayoutIndex(object):
+    """Dispatch index of ``ILayout`` registrations.
+
+    Registrations are stored in nested mappings
+    name -> root spec -> request spec -> context spec. Lookup walks
+    resolution orders of root, request and context specs in same order
+    as multi-adapter lookup, results are memoized.
+    """
+
+    def __init__(self):
+        self.table = {}
+        self.memo = {}
+
+    def add(self, name, required, layout):
+        root, iface, context = required
+        self.table.setdefault(name, {}).setdefault(
+            root, {}).setdefault(iface, {})[context] = layout
+        self.memo.clear()
+
+    def lookup(self, name, root, iface, context):
+        key = (name, root, iface, context)
+        try:
+            return self.memo[key]
+        except KeyError:
+            pass
+
+        layout = None
+        roots = self.table.get(name)
+        if roots:
+            layout = self._lookup(roots, root, iface, context)
+
+        self.memo[key] = layout
+        return layout
+
+    def _lookup(self, roots, root, iface, context):
+        for rspec in root.__sro__:
+            ifaces = roots.get(rspec)
+            if not ifaces:
+                continue
+            for ispec in iface.__sro__:
+                contexts = ifaces.get(ispec)
+                if not contexts:
+                    continue
+                for cspec in context.__sro__:
+                    layout = contexts.get(cspec)
+                    if layout is not None:
+                        return layout
+        return None
+
+
+def layout_index(registry):
+    """ layouts dispatch index, built from registry on first use """
+    index = getattr(registry, '_djed_layout_index', None)
+    if index is None:
+        index = LayoutIndex()
+        for reg in registry.registeredAdapters():
+            if reg.provided is ILayout:
+                index.add(reg.name, reg.required, reg.factory)
+        registry._djed_layout_index = index
+    return index
+
+
+def _chain_cache(registry):
+    try:
+        return registry._djed_layout_chains
+    except AttributeError:
+        cache = registry._djed_layout_chains = {}
+        return cache
+
+
+def _fragment_cache(registry):
+    try:
+        return registry._djed_layout_fragments
+    except AttributeError:
+        settings = registry.settings or {}
+        cache = LRUCache(
+            int(settings.get('djed.layout.fragment_cache_size', 1000)))
+
+        factory = settings.get('djed.layout.fragment_cache_backend')
+        if factory is not None:
+            cache = TieredCache(
+                cache, factory(settings, 'djed.layout.fragment_cache'))
+
+        registry._djed_layout_fragments = cache
+        return cache
+
+
+def layout_cache_stats(registry):
+    """ statistics of layout fragments and output caches """
+    return {'fragments': _fragment_cache(registry).stats(),
+            'output': get_output_cache(registry).stats()}
+
+
+def _view_executor(registry):
+    try:
+        return registry._djed_layout_executor
+    except AttributeError:
+        settings = registry.settings or {}
+        workers = int(settings.get('djed.layout.concurrent_views', 0))
+        executor = registry._djed_layout_executor = (
+            ThreadPoolExecutor(workers) if workers else None)
+        return executor
+
+
+def _with_threadlocals(view):
+    """ call view with pyramid threadlocals of request,
+    for layout views running in executor threads """
+    def call(context, request):
+        manager.push({'request': request, 'registry': request.registry})
+        try:
+            return view(context, request)
+        finally:
+            manager.pop()
+    return call
+
+
+def _gather(results):
+    """ wait for coroutines returned by layout views """
+    indexes = [idx for idx, res in enumerate(results)
+               if asyncio.iscoroutine(res)]
+    if not indexes:
+        return results
+
+    loop = asyncio.new_event_loop()
+    try:
+        tasks = [loop.create_task(results[idx]) for idx in indexes]
+        for task in tasks:
+            loop.run_until_complete(task)
+    finally:
+        loop.close()
+
+    results = list(results)
+    for idx, task in zip(indexes, tasks):
+        results[idx] = task.result()
+    return results
+
+
+def _debug_cache(registry):
+    try:
+        return registry._djed_layout_debug
+    except AttributeError:
+        cache = registry._djed_layout_debug = {}
+        return cache
+
+
+def layout_debug(request):
+    """Check if layout debug is enabled for request.
+
+    Debug is enabled with ``djed.layout.debug`` setting, for requests
+    with ``djed.layout.debug_header`` header or
+    ``djed.layout.debug_cookie`` cookie, or for
+    ``djed.layout.debug_sample`` fraction of requests.
+    """
+    try:
+        return request._layout_debug
+    except AttributeError:
+        pass
+
+    settings = request.registry.settings or {}
+
+    debug = bool(settings.get('djed.layout.debug'))
+    if not debug:
+        header = settings.get('djed.layout.debug_header')
+        cookie = settings.get('djed.layout.debug_cookie')
+        sample = settings.get('djed.layout.debug_sample')
+
+        debug = bool(
+            (header and request.headers.get(header)) or
+            (cookie and request.cookies.get(cookie)) or
+            (sample and random.random() < sample))
+
+    request._layout_debug = debug
+    return debug
+
+
+def layout_color(name):
+    """ stable debug border color for layout """
+    return zlib.crc32(name.encode('utf-8')) & 0xFFFFFF
+
+
+def get_output_cache(registry):
+    """ layouts output cache, created by
+    ``djed.layout.output_cache_backend`` factory """
+    try:
+        return registry._djed_layout_output_cache
+    except AttributeError:
+        settings = registry.settings or {}
+        factory = (settings.get('djed.layout.output_cache_backend') or
+                   memory_cache_factory)
+        cache = registry._djed_layout_output_cache = factory(settings)
+        return cache
+
+
+def _version_cache(registry):
+    try:
+        return registry._djed_layout_versions
+    except AttributeError:
+        cache = registry._djed_layout_versions = {}
+        return cache
+
+
+def layout_version(layout, registry):
+    """Layout template version.
+
+    Modification time and size of template file, cached unless
+    templates reloading is enabled.
+    """
+    settings = registry.settings or {}
+    reload = settings.get('reload_templates')
+
+    cache = _version_cache(registry)
+    if not reload:
+        try:
+            return cache[layout.discriminator]
+        except KeyError:
+            pass
+
+    renderer = layout.renderer
+    name = getattr(renderer, 'name', None)
+    version = '%s.%s' % (renderer.__class__.__module__,
+                         renderer.__class__.__name__)
+    if isinstance(name, string_types) and '.' in name:
+        try:
+            path = AssetResolver(
+                getattr(renderer, 'package', None)).resolve(name).abspath()
+            stat = os.stat(path)
+        except (OSError, ValueError, ImportError):
+            version = name
+        else:
+            version = '%s:%s:%s' % (name, stat.st_mtime, stat.st_size)
+
+    cache[layout.discriminator] = version
+    return version
+
+
+def clear_layout_cache(registry):
+    """ drop resolved layout chains and cached layout fragments,
+    called when layouts registry changes """
+    _chain_cache(registry).clear()
+
+    # shared fragments are keyed by template versions, they are
+    # kept for other processes
+    fragments = _fragment_cache(registry)
+    if isinstance(fragments, TieredCache):
+        fragments = fragments.local
+    fragments.clear()
+
+    _debug_cache(registry).clear()
+    _version_cache(registry).clear()
+    registry._djed_layout_plan = None
+    registry._djed_layout_index = None
+
+
+def iter_layouts(registry):
+    """ iterate over registered layouts """
+    for reg in registry.registeredAdapters():
+        if reg.provided is ILayout:
+            yield reg.factory
+
+
+class LayoutPlan(object):
+    """ names of registered layouts, used by :func:`query_layout`
+    to skip lookups of unknown names
+
+    :param parents: mapping of layout name to set of parent layout names
+    """
+
+    def __init__(self, parents):
+        self.parents = parents
+        self.names = frozenset(parents)
+
+
+def _may_match(spec1, spec2):
+    """ check if same object may provide both specs """
+    return spec1.isOrExtends(spec2) or spec2.isOrExtends(spec1)
+
+
+def compile_layouts(registry):
+    """Check static layouts graph.
+
+    Graph is built per registration, parent of layout is any
+    registration of parent name for same or more general root
+    and matching route.
+    Raises ``ConfigurationError`` for missing parent layouts and
+    for cycles of registrations for any context, such cycles are
+    repeated for every context of lineage. Cycles with registration
+    for specific context end when lineage moves above that context.
+    Returned plan allows to skip lookups for names without
+    registered layouts.
+    """
+    nodes = OrderedDict()
+    for reg in registry.registeredAdapters():
+        if reg.provided is ILayout:
+            nodes[reg.factory.discriminator] = (reg.factory, reg.required)
+
+    parents = {}
+    for layout, required in nodes.values():
+        names = parents.setdefault(layout.name, set())
+        if layout.layout is not None:
+            names.add(layout.layout)
+
+    for name, names in sorted(parents.items()):
+        for parent in sorted(names):
+            if parent not in parents:
+                raise ConfigurationError(
+                    "Parent layout '%s' of layout '%s' is not registered" % (
+                        parent, name))
+
+    # only registrations for any context may form endless cycles
+    nodes = OrderedDict(
+        (discr, node) for discr, node in nodes.items()
+        if node[1][2] is Interface)
+
+    # name -> root spec -> registrations
+    buckets = {}
+    for discr, (layout, (root, iface, context)) in nodes.items():
+        buckets.setdefault(layout.name, {}).setdefault(
+            root, []).append((discr, iface))
+
+    edges = {}
+    for discr, (layout, (root, iface, context)) in nodes.items():
+        roots = buckets.get(layout.layout, {})
+        edges[discr] = [
+            pdiscr for rspec in root.__sro__
+            for pdiscr, piface in roots.get(rspec, ())
+            if _may_match(iface, piface)]
+
+    visited = set()
+
+    def visit(discr, path):
+        if discr in path:
+            cycle = path[path.index(discr):] + [discr]
+            raise ConfigurationError(
+                "Layouts cycle: %s" % ' -> '.join(
+                    repr(nodes[d][0].name) for d in cycle))
+        if discr in visited:
+            return
+        path.append(discr)
+        for parent in edges[discr]:
+            visit(parent, path)
+        path.pop()
+        visited.add(discr)
+
+    for discr in nodes:
+        visit(discr, [])
+
+    plan = LayoutPlan(parents)
+    registry._djed_layout_plan = plan
+    return plan
+
+
+def warmup_layouts(registry, workers=None):
+    """Load and compile templates of registered layouts.
+
+    Templates are compiled in thread pool, raises
+    ``ConfigurationError`` for broken templates. Returns
+    number of compiled templates.
+    """
+    started = perf_counter()
+
+    renderers = OrderedDict()
+    for layout in iter_layouts(registry):
+        if isinstance(layout.renderer, RendererHelper):
+            renderers.setdefault(
+                (layout.renderer.name, layout.renderer.package), layout)
+
+    def load(layout):
+        try:
+            template = getattr(layout.renderer.renderer, 'template', None)
+            cook_check = getattr(template, 'cook_check', None)
+            if cook_check is not None:
+                cook_check()
+        except Exception as exc:
+            raise ConfigurationError(
+                "Can't load template '%s' of layout '%s': %s" % (
+                    layout.renderer.name, layout.name, exc))
+
+    with ThreadPoolExecutor(workers or None) as executor:
+        for _ in executor.map(load, renderers.values()):
+            pass
+
+    log.info("Loaded %d layout templates in %.3fs",
+             len(renderers), perf_counter() - started)
+    return len(renderers)
+
+
 def query_layout_chain(root, context, request, layoutname=''):
+    """ query chain of layouts for context
+
+    Resolved chain depends only on interfaces of root, request and
+    context lineage, so it is cached per registry as list of
+    (layout, lineage offset) pairs.
+    """
+    try:
+        iface = request.request_iface
+    except AttributeError:
+        iface = IRequest
+
+    contexts = list(lineage(context))
+    key = (providedBy(root), iface,
+           tuple(providedBy(ctx) for ctx in contexts), layoutname)
+
+    cache = _chain_cache(request.registry)
+    try:
+        offsets = cache[key]
+    except KeyError:
+        pass
+    else:
+        return [(layout, contexts[idx]) for layout, idx in offsets]
+
+    chain = _resolve_layout_chain(root, context, request, layoutname)
+
+    offsets = []
+    for layout, layoutcontext in chain:
+        for idx, ctx in enumerate(contexts):
+            if ctx is layoutcontext:
+                offsets.append((layout, idx))
+                break
+        else:
+            return chain
+
+    cache[key] = offsets
+    return chain
+
+
+def _resolve_layout_chain(root, context, request, layoutname=''):
     chain = []
 
     layout, layoutcontext = query_layout(root, context, request, layoutname)
@@ -83,7 +546,7 @@ def query_layout_chain(root, context, request, layoutname=''):
 
 def add_layout(cfg, name='', context=None, root=None, parent=None,
                renderer=None, route_name=None, use_global_views=True,
-               view=None):
+               view=None, cacheable=False, cache_vary=None):
     """Registers a layout.
 
     :param name: Layout name
@@ -96,29 +559,48 @@ def add_layout(cfg, name='', context=None, root=None, parent=None,
     :param use_global_views: Apply layout to all routes. even is route
         doesnt use use_global_views.
     :param view: View callable
+    :param cacheable: Layout output depends only on content, it is
+        rendered once and cached as prefix and suffix fragments.
+    :param cache_vary: Callable ``(context, request)``, returns
+        additional cache key for cacheable layout, e.g. locale.
 
     """
 
-    discr = (LAYOUT_ID, name, context, route_name)
+    name = sys.intern(name)
 
-    intr = Introspectable(LAYOUT_ID, discr, name, 'djed:layout')
+    discr = (LAYOUT_ID, name, context, root, route_name)
 
-    intr['name'] = name
-    intr['context'] = context
-    intr['root'] = root
-    intr['renderer'] = renderer
-    intr['route_name'] = route_name
-    intr['parent'] = parent
-    intr['use_global_views'] = use_global_views
-    intr['view'] = view
+    settings = cfg.registry.settings or {}
+    if settings.get('djed.layout.introspection', True):
+        intr = Introspectable(LAYOUT_ID, discr, name, 'djed:layout')
+
+        intr['name'] = name
+        intr['context'] = context
+        intr['root'] = root
+        intr['renderer'] = renderer
+        intr['route_name'] = route_name
+        intr['parent'] = parent
+        intr['use_global_views'] = use_global_views
+        intr['view'] = view
+        intr['cacheable'] = cacheable
+        introspectables = (intr,)
+    else:
+        intr = None
+        introspectables = ()
 
     if not parent:
         parent = None
     elif parent == '.':
         parent = ''
+    else:
+        parent = sys.intern(parent)
 
     if isinstance(renderer, string_types):
-        renderer = RendererHelper(name=renderer, registry=cfg.registry)
+        if renderer.startswith(SLOT_PREFIX):
+            renderer = slot_renderer(
+                cfg.registry, renderer[len(SLOT_PREFIX):], cfg.package)
+        else:
+            renderer = renderer_helper(cfg.registry, renderer)
 
     if context is None:
         context = Interface
@@ -135,84 +617,557 @@ def add_layout(cfg, name='', context=None, root=None, parent=None,
         mapper = getattr(view, '__view_mapper__', DefaultViewMapper)
         mapped_view = mapper()(view)
 
-        info = LayoutInfo(name, parent, mapped_view, view, renderer, intr)
+        info = LayoutInfo(name, parent, mapped_view, view, renderer, intr,
+                          discr, cacheable, cache_vary)
         cfg.registry.registerAdapter(
             info, (root, request_iface, context), ILayout, name)
+        clear_layout_cache(cfg.registry)
 
-    cfg.action(discr, register, introspectables=(intr,))
+    cfg.action(discr, register, introspectables=introspectables)
 
 
-class LayoutRenderer(object):
+def renderer_helper(registry, renderer):
+    """ renderer helper, shared by layouts with same renderer name """
+    try:
+        helpers = registry._djed_layout_helpers
+    except AttributeError:
+        helpers = registry._djed_layout_helpers = {}
+
+    try:
+        return helpers[renderer]
+    except KeyError:
+        helper = helpers[renderer] = RendererHelper(
+            name=renderer, registry=registry)
+        return helper
+
+
+def _release_template(name, helper):
+    """ drop loaded template of renderer, it is loaded again
+    on next render """
+    renderer = helper.__dict__.get('renderer')
+    if renderer is not None:
+        renderer.__dict__.pop('template', None)
+
+
+def _template_cache(registry):
+    try:
+        return registry._djed_layout_templates
+    except AttributeError:
+        settings = registry.settings or {}
+        size = int(settings.get('djed.layout.template_cache_size', 0))
+        cache = registry._djed_layout_templates = (
+            LRUCache(size, on_evict=_release_template) if size else None)
+        return cache
+
+
+LayoutTiming = namedtuple('LayoutTiming', 'name view render size')
+
+
+class LayoutTimings(object):
+    """Timings of layout rendering, in seconds.
+
+    ``levels`` contains :class:`LayoutTiming` for each chain level,
+    ``size`` is length of layout output without wrapped content.
+    If layout views run concurrently ``views`` is time of all views.
+    """
 
     def __init__(self, layout):
         self.layout = layout
+        self.resolve = 0.0
+        self.views = 0.0
+        self.levels = []
 
-    def layout_info(self, layout, context, request, content):
-        intr = layout.intr
-        view = intr['view']
-        if view is not None:
-            layout_factory = '%s.%s'%(view.__module__, view.__name__)
-        else:
-            layout_factory = 'None'
+    @property
+    def total(self):
+        return self.resolve + self.views + sum(
+            l.view + l.render for l in self.levels)
+
+    def add(self, name, view, render, size):
+        self.levels.append(LayoutTiming(name, view, render, size))
+
+
+def _start_timings(request, layout):
+    settings = request.registry.settings
+    if not settings or not settings.get('djed.layout.timing'):
+        return None
+
+    timings = LayoutTimings(layout)
+    try:
+        request.layout_timings.append(timings)
+    except AttributeError:
+        request.layout_timings = [timings]
+    return timings
+
+
+def _finish_timings(request, timings):
+    callback = request.registry.settings.get('djed.layout.timing_callback')
+    if callback is not None:
+        callback(request, timings)
+
+
+def server_timing(timings):
+    """ format ``Server-Timing`` header value, durations in ms """
+    def desc(name):
+        return name.replace('\\', '\\\\').replace('"', '\\"')
+
+    metrics = []
+    for idx, item in enumerate(timings):
+        metrics.append('layout-resolve-%d;desc="%s";dur=%.3f' % (
+            idx, desc(item.layout), item.resolve * 1000))
+        if item.views:
+            metrics.append('layout-views-%d;dur=%.3f' % (
+                idx, item.views * 1000))
+        for level, timing in enumerate(item.levels):
+            metrics.append('layout-view-%d-%d;desc="%s";dur=%.3f' % (
+                idx, level, desc(timing.name), timing.view * 1000))
+            metrics.append('layout-render-%d-%d;desc="%s";dur=%.3f' % (
+                idx, level, desc(timing.name), timing.render * 1000))
+
+    return ', '.join(metrics)
+
+
+def limit_chain(chain, depth):
+    """Limit layouts chain for partial rendering.
+
+    :param depth: Number of innermost layouts to render, or name
+        of the outermost layout to render. None means whole chain.
+    """
+    if depth is None:
+        return chain
+
+    if isinstance(depth, string_types):
+        for idx, (layout, layoutcontext) in enumerate(chain):
+            if layout.name == depth:
+                return chain[:idx + 1]
+        return chain
+
+    return chain[:max(depth, 0)]
+
+
+def parse_layout_depth(value):
+    """ parse layout depth header value """
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return value
+
+
+class Fragment(object):
+    """ layout output around content """
 
-        data = OrderedDict(
-            (('name', intr['name']),
-             ('parent-layout', intr['parent']),
-             ('layout-factory', layout_factory),
-             ('renderer', intr['renderer']),
-             ('context', '%s.%s'%(context.__class__.__module__,
-                                  context.__class__.__name__)),
-             ('context-path', request.resource_url(context)),
-             ))
+    __slots__ = ('head', 'tail', '_encoded')
 
-        html = re.search('<html\.*>', content)
-        color = random.randint(0,0xFFFFFF)
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+        self._encoded = {}
 
+    def encoded(self, charset):
+        try:
+            return self._encoded[charset]
+        except KeyError:
+            res = self._encoded[charset] = (
+                self.head.encode(charset), self.tail.encode(charset))
+            return res
+
+
+def split_output(result):
+    """ split layout output rendered around content marker,
+    returns fragment or None if output can not be split """
+    head, marker, tail = result.partition(CONTENT_MARKER)
+    if not marker or CONTENT_MARKER in tail:
+        return None
+
+    return Fragment(head, tail)
+
+
+class LayoutRenderer(object):
+
+    def __init__(self, layout):
+        self.layout = layout
+
+    def debug_data(self, layout, context, request):
+        """ layout debug information """
+        cache = _debug_cache(request.registry)
+        try:
+            static = cache[layout.discriminator]
+        except KeyError:
+            intr = layout.intr
+            if intr is None:
+                # introspection is disabled
+                intr = {'name': layout.name,
+                        'parent': layout.layout,
+                        'view': layout.original,
+                        'renderer': getattr(
+                            layout.renderer, 'name', layout.renderer)}
+
+            view = intr['view']
+            if view is not None:
+                layout_factory = '%s.%s'%(view.__module__, view.__name__)
+            else:
+                layout_factory = 'None'
+
+            static = cache[layout.discriminator] = (
+                ('name', intr['name']),
+                ('parent-layout', intr['parent']),
+                ('layout-factory', layout_factory),
+                ('renderer', intr['renderer']))
+
+        return OrderedDict(static + (
+            ('context', '%s.%s'%(context.__class__.__module__,
+                                 context.__class__.__name__)),
+            ('context-path', request.resource_url(context)),
+            ))
+
+    def debug_fragment(self, layout, context, request, fragment):
+        """ annotate layout fragment, wrapped content is not scanned """
+        data = self.debug_data(layout, context, request)
+        color = layout_color(data['name'])
+        head, tail = fragment.head, fragment.tail
+
+        html = HTML_RE.search(head)
         if html:
             pos = html.end() - 1
-            content = ('{0} style="border: 2px solid #{1:06x}" title="{2}"'
-                       '{3}').format(content[:pos], color, data['name'],
-                                     content[pos:])
+            head = ('{0} style="border: 2px solid #{1:06x}" title="{2}"'
+                    '{3}').format(head[:pos], color, data['name'], head[pos:])
         else:
-            content = ('<div style="border: 2px solid #{0:06x}" title="{1}">'
-                       '{2}</div>').format(color, data['name'], content)
+            head = ('<div style="border: 2px solid #{0:06x}" title="{1}">'
+                    '{2}').format(color, data['name'], head)
+            tail = tail + '</div>'
 
-        content = '\n<!-- layout:\n{0} \n-->\n{1}'.format(
-            json.dumps(data, indent=2), content)
+        head = '\n<!-- layout:\n{0} \n-->\n{1}'.format(
+            json.dumps(data, indent=2), head)
 
-        return content
+        return Fragment(head, tail)
+
+    def layout_info(self, layout, context, request, content):
+        """ annotate rendered layout output, see :meth:`debug_fragment` """
+        fragment = self.debug_fragment(
+            layout, context, request, Fragment(content, ''))
+        return fragment.head + fragment.tail
+
+    def chain(self, context, request):
+        """Resolved layouts chain, memoized per request.
+
+        Chain is limited by ``request.layout_depth``, see
+        :func:`limit_chain`.
+        """
+        try:
+            chains = request._layout_chains
+        except AttributeError:
+            chains = request._layout_chains = {}
+
+        key = (id(context), self.layout)
+        memo = chains.get(key)
+        if memo is not None and memo[0] is context:
+            chain = memo[1]
+        else:
+            chain = query_layout_chain(
+                request.root, context, request, self.layout)
+            if not chain:
+                log.warning(
+                    "Can't find layout '%s' for context '%s'",
+                    self.layout, context)
+            chains[key] = (context, chain)
+
+        return limit_chain(chain, getattr(request, 'layout_depth', None))
+
+    def update_data(self, layout, context, request):
+        install_providers(
+            request.registry, request.layout_data,
+            layout.name, context, request)
+
+        if layout.view is not None:
+            vdata = layout.view(context, request)
+            if asyncio.iscoroutine(vdata):
+                vdata = _gather([vdata])[0]
+            if vdata is not None:
+                request.layout_data.update(vdata)
+
+    def update_chain_data(self, chain, request, executor, timings=None):
+        """ run layout views of chain concurrently, data is merged
+        in chain order """
+        if timings is not None:
+            started = perf_counter()
+
+        value = request.layout_data
+        for layout, layoutcontext in chain:
+            install_providers(
+                request.registry, value, layout.name, layoutcontext, request)
+
+        futures = [executor.submit(_with_threadlocals(layout.view),
+                                   layoutcontext, request)
+                   for layout, layoutcontext in chain
+                   if layout.view is not None]
+
+        for vdata in _gather([future.result() for future in futures]):
+            if vdata is not None:
+                value.update(vdata)
+
+        if timings is not None:
+            timings.views = perf_counter() - started
+
+    def render_layout(self, layout, context, request, content):
+        render_slots = getattr(layout.renderer, 'render_slots', None)
+        if render_slots is not None:
+            return render_slots(request.layout_data, content, request)
+
+        system = {'view': getattr(request, '__view__', None),
+                  'renderer_info': layout.renderer,
+                  'context': context,
+                  'request': request,
+                  'content': content,
+                  'wrapped_content': content}
+
+        templates = _template_cache(request.registry)
+        if templates is not None and \
+                isinstance(layout.renderer, RendererHelper) and \
+                templates.get(layout.renderer.name) is None:
+            templates.set(layout.renderer.name, layout.renderer)
+
+        return layout.renderer.render(request.layout_data, system, request)
+
+    def split_layout(self, layout, context, request):
+        """ render layout around content marker, returns fragment
+        or None if layout output can not be split """
+        return split_output(
+            self.render_layout(layout, context, request, CONTENT_MARKER))
+
+    def lookup_fragment(self, layout, context, request):
+        """ cache key and cached fragment of cacheable layout,
+        fragment is None if it is not cached """
+        vary = None
+        if layout.vary is not None:
+            vary = layout.vary(context, request)
+
+        key = (layout.discriminator,
+               layout_version(layout, request.registry),
+               providedBy(context), vary)
+
+        return key, tags.lookup(
+            _fragment_cache(request.registry), key, request.registry)
+
+    def store_fragment(self, key, fragment, layout, request):
+        """ cache fragment of cacheable layout """
+        tags.store(_fragment_cache(request.registry), key,
+                   fragment or NOT_SPLITTABLE, request,
+                   self.cache_tags([layout], request))
+
+    def fragment(self, layout, context, request):
+        """ layout fragment, cached for cacheable layouts """
+        if not layout.cacheable:
+            return self.split_layout(layout, context, request)
+
+        key, fragment = self.lookup_fragment(layout, context, request)
+        if fragment is None:
+            fragment = self.split_layout(layout, context, request)
+            self.store_fragment(key, fragment, layout, request)
+
+        return fragment or None
 
     def __call__(self, content, context, request):
-        chain = query_layout_chain(request.root, context, request, self.layout)
+        timings = _start_timings(request, self.layout)
+        if timings is not None:
+            started = perf_counter()
+
+        chain = self.chain(context, request)
         if not chain:
-            log.warning(
-                "Can't find layout '%s' for context '%s'",
-                self.layout, context)
             return content
 
-        value = request.layout_data
+        if timings is not None:
+            timings.resolve = perf_counter() - started
+
+        debug = layout_debug(request)
+
+        executor = _view_executor(request.registry)
+        if executor is not None:
+            self.update_chain_data(chain, request, executor, timings)
 
         for layout, layoutcontext in chain:
-            if layout.view is not None:
-                vdata = layout.view(layoutcontext, request)
-                if vdata is not None:
-                    value.update(vdata)
-
-            system = {'view': getattr(request, '__view__', None),
-                      'renderer_info': layout.renderer,
-                      'context': layoutcontext,
-                      'request': request,
-                      'content': content,
-                      'wrapped_content': content}
-
-            content = layout.renderer.render(value, system, request)
-
-            if request.registry.settings.get('djed.layout.debug'):
-                content = self.layout_info(
+            if timings is not None:
+                started = perf_counter()
+                size = len(content)
+
+            if executor is None:
+                self.update_data(layout, layoutcontext, request)
+
+            if timings is not None:
+                rendering = perf_counter()
+
+            fragment = None
+            if layout.cacheable or debug:
+                fragment = self.fragment(layout, layoutcontext, request)
+
+            if fragment is not None:
+                if debug:
+                    fragment = self.debug_fragment(
+                        layout, layoutcontext, request, fragment)
+                content = fragment.head + content + fragment.tail
+            else:
+                content = self.render_layout(
                     layout, layoutcontext, request, content)
+                if debug:
+                    content = self.layout_info(
+                        layout, layoutcontext, request, content)
+
+            if timings is not None:
+                timings.add(layout.name, rendering - started,
+                            perf_counter() - rendering, len(content) - size)
+
+        if timings is not None:
+            _finish_timings(request, timings)
 
         return content
 
+    def wrap(self, app_iter, context, request, charset='utf-8'):
+        """Render layouts around encoded content.
+
+        Content is not decoded unless some layout output can not be
+        split at content slot. Returns tuple of head chunks, content
+        iterable and tail chunks.
+        """
+        timings = _start_timings(request, self.layout)
+        if timings is not None:
+            started = perf_counter()
+
+        chain = self.chain(context, request)
+        if not chain:
+            return [], app_iter, []
+
+        if timings is not None:
+            timings.resolve = perf_counter() - started
+
+        heads = []
+        tails = []
+        debug = layout_debug(request)
+
+        executor = _view_executor(request.registry)
+        if executor is not None:
+            self.update_chain_data(chain, request, executor, timings)
+
+        for layout, layoutcontext in chain:
+            if timings is not None:
+                started = perf_counter()
+
+            if executor is None:
+                self.update_data(layout, layoutcontext, request)
+
+            if timings is not None:
+                rendering = perf_counter()
+
+            fragment = self.fragment(layout, layoutcontext, request)
+            if fragment is None:
+                content = b''.join(
+                    itertools.chain(reversed(heads), app_iter, tails))
+                close = getattr(app_iter, 'close', None)
+                if close is not None:
+                    close()
+                size = len(content)
+                content = self.render_layout(
+                    layout, layoutcontext, request, content.decode(charset))
+                if debug:
+                    content = self.layout_info(
+                        layout, layoutcontext, request, content)
+                app_iter = [content.encode(charset)]
+                size = len(app_iter[0]) - size
+                heads = []
+                tails = []
+            else:
+                if debug:
+                    fragment = self.debug_fragment(
+                        layout, layoutcontext, request, fragment)
+                head, tail = fragment.encoded(charset)
+                heads.append(head)
+                tails.append(tail)
+                size = len(head) + len(tail)
+
+            if timings is not None:
+                timings.add(layout.name, rendering - started,
+                            perf_counter() - rendering, size)
+
+        if timings is not None:
+            _finish_timings(request, timings)
+
+        heads.reverse()
+        return heads, app_iter, tails
+
+    def etag(self, body, context, request):
+        """Strong entity tag for layouts output.
+
+        Computed from encoded content, layout templates versions,
+        ``cache_vary`` keys and versions of layout and root tags, so
+        :func:`invalidate_layouts` changes it. Returns None if some
+        layout in chain is not cacheable, its output may depend on
+        anything.
+        """
+        chain = self.chain(context, request)
+        if not chain:
+            return None
+
+        parts = []
+        for layout, layoutcontext in chain:
+            if not layout.cacheable:
+                return None
+
+            vary = None
+            if layout.vary is not None:
+                vary = layout.vary(layoutcontext, request)
+
+            parts.append((layout.discriminator,
+                          layout_version(layout, request.registry), vary))
+
+        versions = tags.tag_versions(request.registry)
+        parts.append(tuple(
+            (tag, tags._version(versions, tag)) for tag in
+            self.cache_tags([layout for layout, _ in chain], request)))
+
+        digest = hashlib.sha1(body)
+        digest.update(repr(parts).encode('utf-8'))
+        return digest.hexdigest()
+
+    def cache_key(self, body, context, request, vary=None):
+        """ output cache key for encoded content, computed from content,
+        resolved chain and vary value """
+        chain = self.chain(context, request)
+        if not chain:
+            return None
+
+        parts = [self.layout, vary]
+        for layout, layoutcontext in chain:
+            parts.append((layout.discriminator, providedBy(layoutcontext),
+                          layout_version(layout, request.registry)))
+
+        digest = hashlib.sha1(body)
+        digest.update(repr(parts).encode('utf-8'))
+        return digest.hexdigest()
+
+    def cache_tags(self, layouts, request):
+        """ implicit tags of cached output of layouts """
+        names = [tags.layout_tag(layout.name) for layout in layouts]
+        root = getattr(request, 'root', None)
+        if root is not None:
+            names.append(tags.root_tag(root))
+        return names
+
+    def render_chunks(self, body, context, request, charset='utf-8'):
+        """ render layouts around encoded body, returns list of chunks """
+        heads, app_iter, tails = self.wrap([body], context, request, charset)
+        return heads + list(app_iter) + tails
+
+
+def get_layout_renderer(registry, name, factory=LayoutRenderer):
+    """ layout renderer, shared per registry """
+    try:
+        renderers = registry._djed_layout_renderers
+    except AttributeError:
+        renderers = registry._djed_layout_renderers = {}
+
+    try:
+        return renderers[(factory, name)]
+    except KeyError:
+        renderer = renderers[(factory, name)] = factory(name)
+        return renderer
+
 
 def set_layout_data(request, **kw):
     request.layout_data.update(kw)
@@ -221,7 +1176,8 @@ def set_layout_data(request, **kw):
 class layout_config(object):
 
     def __init__(self, name='', context=None, root=None, parent=None,
-                 renderer=None, route_name=None, use_global_views=True):
+                 renderer=None, route_name=None, use_global_views=True,
+                 cacheable=False, cache_vary=None):
         self.name = name
         self.context = context
         self.root = root
@@ -229,6 +1185,8 @@ class layout_config(object):
         self.renderer = renderer
         self.route_name = route_name
         self.use_global_views = use_global_views
+        self.cacheable = cacheable
+        self.cache_vary = cache_vary
 
     def __call__(self, wrapped):
         def callback(context, name, ob):
@@ -236,29 +1194,192 @@ class layout_config(object):
             add_layout(cfg, self.name, self.context,
                        self.root, self.parent,
                        self.renderer, self.route_name,
-                       self.use_global_views, ob)
+                       self.use_global_views, ob,
+                       self.cacheable, self.cache_vary)
 
         info = venusian.attach(wrapped, callback, category='djed:layout')
 
         return wrapped
 
 
+def stream_chunks(heads, app_iter, tails):
+    """ iterate over layout heads, content and layout tails """
+    try:
+        for chunk in heads:
+            yield chunk
+        for chunk in app_iter:
+            yield chunk
+        for chunk in tails:
+            yield chunk
+    finally:
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+def is_wrappable(request, response, settings):
+    """ check if layout can be applied to response,
+    response body is not accessed """
+    if request.method == 'HEAD' and settings['djed.layout.skip_head']:
+        return False
+
+    if response.status_int in settings['djed.layout.skip_status']:
+        return False
+
+    content_types = settings['djed.layout.content_types']
+    if content_types and response.content_type not in content_types:
+        return False
+
+    max_length = settings['djed.layout.max_content_length']
+    if max_length and response.content_length is not None and \
+            response.content_length > max_length:
+        return False
+
+    if not isinstance(response.app_iter, (list, tuple)) and \
+            not settings['djed.layout.stream']:
+        return False
+
+    return True
+
+
 class layout_tween_factory(object):
     def __init__(self, handler, registry):
         self.handler = handler
         self.registry = registry
 
+    def not_modified(self, layout, request, response):
+        """ set layout entity tag, convert response to
+        ``304 Not Modified`` if client has same entity. Entity tag set
+        by view is kept, debug annotated responses are not tagged """
+        if request.method not in ('GET', 'HEAD') or \
+                response.status_int != 200 or \
+                not isinstance(response.app_iter, (list, tuple)) or \
+                response.etag is not None or layout_debug(request):
+            return False
+
+        etag = layout.etag(response.body, request.context, request)
+        if etag is None:
+            return False
+
+        response.etag = etag
+        if etag not in request.if_none_match:
+            return False
+
+        response.status_int = 304
+        response.app_iter = []
+        response.content_length = None
+        del response.content_type
+        return True
+
+    def cached(self, layout, request, response):
+        """ serve layouts output from output cache, debug annotated
+        output is not cached """
+        if request.method != 'GET' or response.status_int != 200 or \
+                not isinstance(response.app_iter, (list, tuple)) or \
+                layout_debug(request):
+            return False
+
+        charset = response.charset or 'utf-8'
+        vary = self.registry.settings['djed.layout.output_cache_vary']
+        if vary is not None:
+            vary = vary(request)
+
+        body = response.body
+        key = layout.cache_key(
+            body, request.context, request, (charset, vary))
+        if key is None:
+            return False
+
+        cache = get_output_cache(self.registry)
+        output = tags.lookup(cache, key, self.registry)
+        if output is None:
+            if self.registry.settings['djed.layout.minify']:
+                output = b''.join(minify_stage(self.registry).chunks(
+                    *layout.wrap([body], request.context, request, charset)))
+            else:
+                output = b''.join(layout.render_chunks(
+                    body, request.context, request, charset))
+            chain = layout.chain(request.context, request)
+            tags.store(cache, key, output, request, layout.cache_tags(
+                [l for l, _ in chain], request))
+
+        response.body = output
+        return True
+
+    def render(self, layout, request, response):
+        settings = self.registry.settings
+        if settings['djed.layout.minify']:
+            heads, app_iter, tails = layout.wrap(
+                response.app_iter, request.context, request,
+                response.charset or 'utf-8')
+            chunks = minify_stage(self.registry).chunks(
+                heads, app_iter, tails)
+            if settings['djed.layout.stream']:
+                response.app_iter = chunks
+                response.content_length = None
+            else:
+                response.body = b''.join(chunks)
+        elif settings['djed.layout.stream']:
+            heads, app_iter, tails = layout.wrap(
+                response.app_iter, request.context, request,
+                response.charset or 'utf-8')
+            response.app_iter = stream_chunks(heads, app_iter, tails)
+            response.content_length = None
+        elif settings['djed.layout.bytes']:
+            chunks = layout.render_chunks(
+                response.body, request.context, request,
+                response.charset or 'utf-8')
+            response.app_iter = chunks
+            response.content_length = sum(len(c) for c in chunks)
+        else:
+            response.text = layout(response.text, request.context, request)
+
     def __call__(self, request):
         response = self.handler(request)
 
         layout_name = getattr(request, 'layout', None)
-        if layout_name:
-            layout = LayoutRenderer(layout_name)
-            response.text = layout(response.text, request.context, request)
+        if layout_name and is_wrappable(
+                request, response, self.registry.settings):
+            layout = get_layout_renderer(self.registry, layout_name)
+            settings = self.registry.settings
+
+            header = settings['djed.layout.depth_header']
+            if header is not None:
+                response.vary = tuple(response.vary or ()) + (header,)
+                if getattr(request, 'layout_depth', None) is None and \
+                        header in request.headers:
+                    request.layout_depth = parse_layout_depth(
+                        request.headers[header])
+
+            if settings['djed.layout.etag'] and \
+                    self.not_modified(layout, request, response):
+                return response
+
+            if not (settings['djed.layout.output_cache'] and
+                    self.cached(layout, request, response)):
+                self.render(layout, request, response)
+
+            timings = getattr(request, 'layout_timings', None)
+            if timings and settings['djed.layout.timing_header']:
+                response.headers.add('Server-Timing', server_timing(timings))
 
         return response
 
 
+class layout_depth_predicate_factory(object):
+    def __init__(self, val, config):
+        self.val = val
+
+    def text(self):
+        return 'layout_depth = %s' % (self.val,)
+
+    phash = text
+
+    def __call__(self, context, request):
+        request.layout_depth = self.val
+        return True
+
+
 class layout_predicate_factory(object):
     def __init__(self, val, config):
         self.val = val
@@ -274,17 +1395,96 @@ class layout_predicate_factory(object):
 
 
 def includeme(config):
-    from pyramid.settings import asbool
+    from pyramid.settings import asbool, aslist
 
     settings = config.registry.settings
     settings['djed.layout.debug'] = asbool(settings.get(
         'djed.layout.debug', 'f'))
+    settings['djed.layout.debug_header'] = settings.get(
+        'djed.layout.debug_header') or None
+    settings['djed.layout.debug_cookie'] = settings.get(
+        'djed.layout.debug_cookie') or None
+    settings['djed.layout.debug_sample'] = float(settings.get(
+        'djed.layout.debug_sample', 0))
+    settings['djed.layout.compile'] = asbool(settings.get(
+        'djed.layout.compile', 'f'))
+    settings['djed.layout.bytes'] = asbool(settings.get(
+        'djed.layout.bytes', 'f'))
+    settings['djed.layout.stream'] = asbool(settings.get(
+        'djed.layout.stream', 'f'))
+    settings['djed.layout.depth_header'] = settings.get(
+        'djed.layout.depth_header') or None
+    settings['djed.layout.etag'] = asbool(settings.get(
+        'djed.layout.etag', 'f'))
+    settings['djed.layout.output_cache'] = asbool(settings.get(
+        'djed.layout.output_cache', 'f'))
+    settings['djed.layout.output_cache_backend'] = config.maybe_dotted(
+        settings.get('djed.layout.output_cache_backend'))
+    settings['djed.layout.fragment_cache_backend'] = config.maybe_dotted(
+        settings.get('djed.layout.fragment_cache_backend'))
+    settings['djed.layout.cache_tags_backend'] = config.maybe_dotted(
+        settings.get('djed.layout.cache_tags_backend'))
+    settings['djed.layout.output_cache_vary'] = config.maybe_dotted(
+        settings.get('djed.layout.output_cache_vary'))
+    settings['djed.layout.concurrent_views'] = int(settings.get(
+        'djed.layout.concurrent_views', 0))
+    settings['djed.layout.timing_header'] = asbool(settings.get(
+        'djed.layout.timing_header', 'f'))
+    settings['djed.layout.timing_callback'] = config.maybe_dotted(
+        settings.get('djed.layout.timing_callback'))
+    settings['djed.layout.content_types'] = frozenset(aslist(settings.get(
+        'djed.layout.content_types', 'text/html application/xhtml+xml')))
+    settings['djed.layout.skip_status'] = frozenset(
+        int(status) for status in aslist(settings.get(
+            'djed.layout.skip_status', '204 206 301 302 303 304 307 308')))
+    settings['djed.layout.max_content_length'] = int(settings.get(
+        'djed.layout.max_content_length', 0))
+    settings['djed.layout.skip_head'] = asbool(settings.get(
+        'djed.layout.skip_head', 't'))
+    settings['djed.layout.introspection'] = asbool(settings.get(
+        'djed.layout.introspection', 't'))
+    settings['djed.layout.template_cache_size'] = int(settings.get(
+        'djed.layout.template_cache_size', 0))
+    settings['djed.layout.minify'] = asbool(settings.get(
+        'djed.layout.minify', 'f'))
+    settings['djed.layout.warmup'] = asbool(settings.get(
+        'djed.layout.warmup', 'f'))
+    settings['djed.layout.warmup_workers'] = int(settings.get(
+        'djed.layout.warmup_workers', 0))
+    settings['djed.layout.prerender_paths'] = tuple(aslist(settings.get(
+        'djed.layout.prerender_paths', '')))
+    settings['djed.layout.timing'] = (
+        asbool(settings.get('djed.layout.timing', 'f')) or
+        settings['djed.layout.timing_header'] or
+        settings['djed.layout.timing_callback'] is not None)
+
+    if settings['djed.layout.compile']:
+        config.action(
+            (LAYOUT_ID, 'compile'),
+            lambda: compile_layouts(config.registry),
+            order=LAYOUT_POST_CONFIG)
+
+    if settings['djed.layout.warmup']:
+        config.action(
+            (LAYOUT_ID, 'warmup'),
+            lambda: warmup_layouts(
+                config.registry, settings['djed.layout.warmup_workers']),
+            order=LAYOUT_POST_CONFIG)
 
     config.add_tween('djed.layout.layout_tween_factory', over=EXCVIEW)
     config.add_view_predicate('layout', layout_predicate_factory)
+    config.add_view_predicate('layout_depth', layout_depth_predicate_factory)
     config.add_directive('add_layout', add_layout)
+    config.add_directive('add_layout_data_provider', add_layout_data_provider)
+    config.add_directive(
+        'invalidate_layouts', tags.invalidate_layouts_directive)
     config.add_request_method(set_layout_data, 'set_layout_data')
+    config.add_request_method(tags.set_layout_cache, 'set_layout_cache')
+    config.add_request_method(
+        tags.invalidate_layouts_request, 'invalidate_layouts')
 
     def get_layout_data(request):
-        return {}
+        data = {}
+        install_providers(request.registry, data, None, None, request)
+        return data
     config.add_request_method(get_layout_data, 'layout_data', True, True)
@@ -0,0 +1,128 @@
+""" asyncio support, layout views and renderers may return awaitables """
+import asyncio
+import inspect
+from pyramid.exceptions import ConfigurationError
+
+from djed.layout import is_wrappable
+from djed.layout import layout_debug
+from djed.layout import split_output
+from djed.layout import LayoutRenderer
+from djed.layout import CONTENT_MARKER
+from djed.layout import get_layout_renderer
+from djed.layout.data import install_providers
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class AsyncLayoutRenderer(LayoutRenderer):
+    """Layout renderer for asyncio applications.
+
+    Layout views of chain are awaited concurrently, data is merged into
+    ``request.layout_data`` in chain order, then layouts are rendered.
+    Renderers may return awaitables.
+    """
+
+    async def gather_chain_data(self, chain, request):
+        """ await layout views of chain concurrently, data is merged
+        in chain order """
+        value = request.layout_data
+        for layout, layoutcontext in chain:
+            install_providers(
+                request.registry, value, layout.name, layoutcontext, request)
+
+        results = await asyncio.gather(
+            *[_maybe_await(layout.view(layoutcontext, request))
+              for layout, layoutcontext in chain
+              if layout.view is not None])
+
+        for vdata in results:
+            if vdata is not None:
+                value.update(vdata)
+
+    async def async_fragment(self, layout, context, request):
+        """ layout fragment, cached for cacheable layouts """
+        if layout.cacheable:
+            key, fragment = self.lookup_fragment(layout, context, request)
+            if fragment is not None:
+                return fragment or None
+
+        fragment = split_output(await _maybe_await(self.render_layout(
+            layout, context, request, CONTENT_MARKER)))
+
+        if layout.cacheable:
+            self.store_fragment(key, fragment, layout, request)
+        return fragment
+
+    async def __call__(self, content, context, request):
+        chain = self.chain(context, request)
+        if not chain:
+            return content
+
+        await self.gather_chain_data(chain, request)
+
+        debug = layout_debug(request)
+
+        for layout, layoutcontext in chain:
+            fragment = None
+            if layout.cacheable or debug:
+                fragment = await self.async_fragment(
+                    layout, layoutcontext, request)
+
+            if fragment is not None:
+                if debug:
+                    fragment = self.debug_fragment(
+                        layout, layoutcontext, request, fragment)
+                content = fragment.head + content + fragment.tail
+            else:
+                content = await _maybe_await(self.render_layout(
+                    layout, layoutcontext, request, content))
+                if debug:
+                    content = self.layout_info(
+                        layout, layoutcontext, request, content)
+
+        return content
+
+
+# layout tween settings not implemented by async tween
+UNSUPPORTED_SETTINGS = (
+    'djed.layout.stream', 'djed.layout.bytes', 'djed.layout.etag',
+    'djed.layout.output_cache', 'djed.layout.minify', 'djed.layout.timing',
+    'djed.layout.depth_header')
+
+
+class async_layout_tween_factory(object):
+    """Layout tween for handlers returning awaitables.
+
+    Response text is rendered with :class:`AsyncLayoutRenderer`,
+    raises ``ConfigurationError`` if any of ``UNSUPPORTED_SETTINGS``
+    is enabled.
+    """
+
+    def __init__(self, handler, registry):
+        settings = registry.settings or {}
+        enabled = [name for name in UNSUPPORTED_SETTINGS
+                   if settings.get(name)]
+        if enabled:
+            raise ConfigurationError(
+                "Async layout tween does not support settings: %s" % (
+                    ', '.join(enabled)))
+
+        self.handler = handler
+        self.registry = registry
+
+    async def __call__(self, request):
+        response = await _maybe_await(self.handler(request))
+
+        layout_name = getattr(request, 'layout', None)
+        if layout_name and is_wrappable(
+                request, response, self.registry.settings):
+            layout = get_layout_renderer(
+                self.registry, layout_name, AsyncLayoutRenderer)
+            response.text = await layout(
+                response.text, request.context, request)
+
+        return response
@@ -0,0 +1,172 @@
+"""Batch rendering.
+
+Renders many ``(content, context)`` pairs through layout chain::
+
+    from djed.layout.batch import render_batch
+
+    for context, html in render_batch(registry, '', items, processes=4):
+        ...
+
+Items are consumed in windows of ``window`` pairs, so memory is
+bounded by window size. Within window items are grouped by
+interfaces of context lineage, chain is resolved once for each group
+task and reused for its items, results are yielded in input order. Process pool
+is opt-in, it forks calling process, so it should not be used from
+threaded servers.
+"""
+import os
+import multiprocessing
+from itertools import islice
+from collections import OrderedDict
+from zope.interface import providedBy
+from pyramid.location import lineage
+from pyramid.scripting import prepare
+from pyramid.traversal import find_root
+
+from djed.layout import get_layout_renderer
+from djed.layout import query_layout_chain
+
+# worker process state, set by pool initializer
+_worker = {}
+
+
+def _request(registry, root, context):
+    env = prepare(registry=registry)
+    request = env['request']
+    request.root = root if root is not None else find_root(context)
+    request.context = context
+    return request, env['closer']
+
+
+def chain_key(registry, name, context, root=None):
+    """ key of layout chain for context, contexts with same key are
+    rendered with same layouts. Chain depends only on interfaces of
+    root and context lineage, so it is not resolved here. """
+    if root is None:
+        root = find_root(context)
+
+    return (name, providedBy(root),
+            tuple(providedBy(ctx) for ctx in lineage(context)))
+
+
+def render_group(registry, name, items, root=None):
+    """ render list of (content, context) pairs with same
+    :func:`chain_key`, returns list of results
+
+    Chain is resolved for first item, it is reused for other items
+    by lineage offsets and seeded into request chain memo. """
+    renderer = get_layout_renderer(registry, name)
+
+    offsets = None
+    results = []
+    for content, context in items:
+        request, closer = _request(registry, root, context)
+        try:
+            contexts = list(lineage(context))
+            if offsets is None:
+                chain = query_layout_chain(
+                    request.root, context, request, name)
+                offsets = [(layout, _offset(contexts, layoutcontext))
+                           for layout, layoutcontext in chain]
+            else:
+                chain = [(layout, contexts[idx]) for layout, idx in offsets]
+
+            request._layout_chains = {(id(context), name): (context, chain)}
+            results.append(renderer(content, context, request))
+        finally:
+            closer()
+
+    return results
+
+
+def _offset(contexts, context):
+    for idx, ctx in enumerate(contexts):
+        if ctx is context:
+            return idx
+
+    raise ValueError("Layout context is not in lineage")  # pragma: no cover
+
+
+def _init_worker(registry, name, root):
+    _worker['registry'] = registry
+    _worker['name'] = name
+    _worker['root'] = root
+
+
+def _render_worker(items):
+    return render_group(
+        _worker['registry'], _worker['name'], items, _worker['root'])
+
+
+def _pool(registry, name, root, processes):
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1:
+        return None
+
+    # registry is inherited by forked workers, it is not picklable
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None  # pragma: no cover
+
+    ctx = multiprocessing.get_context('fork')
+    return ctx.Pool(
+        processes, initializer=_init_worker,
+        initargs=(registry, name, root))
+
+
+def render_batch(registry, name, items, root=None,
+                 processes=1, window=1000, chunksize=50):
+    """Render ``(content, context)`` pairs through layout chain.
+
+    Generator, yields ``(context, result)`` pairs in input order.
+
+    :param registry: Application registry
+    :param name: Layout name
+    :param items: Iterable of ``(content, context)`` pairs
+    :param root: Traversal root, by default root of each context
+    :param processes: Number of worker processes forked from current
+        process, None means number of CPUs. With 1 process, default,
+        or if ``fork`` is not available, items are rendered in current
+        process. Content and context are pickled for worker processes,
+        pickled context includes its whole ``__parent__`` lineage.
+    :param window: Number of items consumed from ``items`` at once
+    :param chunksize: Max number of items sent to worker in one task
+    """
+    pool = _pool(registry, name, root, processes)
+    items = iter(items)
+    try:
+        while True:
+            batch = list(islice(items, window))
+            if not batch:
+                break
+
+            groups = OrderedDict()
+            for idx, (content, context) in enumerate(batch):
+                key = chain_key(registry, name, context, root)
+                groups.setdefault(key, []).append(idx)
+
+            tasks = []
+            for indexes in groups.values():
+                for start in range(0, len(indexes), chunksize):
+                    tasks.append(indexes[start:start + chunksize])
+
+            chunks = [[batch[idx] for idx in task] for task in tasks]
+            if pool is None:
+                rendered = [render_group(registry, name, chunk, root)
+                            for chunk in chunks]
+            else:
+                rendered = pool.map(_render_worker, chunks)
+
+            results = [None] * len(batch)
+            for task, values in zip(tasks, rendered):
+                for idx, value in zip(task, values):
+                    results[idx] = value
+
+            for (content, context), result in zip(batch, results):
+                yield context, result
+
+            del batch, chunks, rendered, results
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
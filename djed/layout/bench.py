@@ -0,0 +1,358 @@
+"""Layout benchmarks.
+
+Builds synthetic resource trees and layout chains, measures chain
+resolution, rendering, allocations and peak memory. Results are
+printed as JSON::
+
+    $ djed-layout-bench --depth 1 10 50 --chain 1 5 10 > results.json
+
+Registry memory is measured with ``--layouts``::
+
+    $ djed-layout-bench --layouts 50000 --roots 5000
+
+"""
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+import pkg_resources
+from zope.interface import Interface, implementer, providedBy
+from zope.interface.interface import InterfaceClass
+from pyramid.config import Configurator
+from pyramid.interfaces import IRequest
+from pyramid.location import lineage
+from pyramid.scripting import prepare
+
+from djed.layout import ILayout
+from djed.layout import LayoutRenderer
+from djed.layout import layout_index
+from djed.layout import query_layout_chain
+from djed.layout import _chain_cache
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+DEPTHS = (1, 5, 10, 25, 50)
+CHAINS = (1, 3, 5, 10)
+RENDERERS = ('string', 'chameleon', 'slot')
+
+TEMPLATE = '<div class="layout-${name}">${structure:content}</div>'
+
+SLOT_TEMPLATE = '<div class="layout-${name}">${content}</div>'
+
+CONTENT = '<p>content</p>\n' * 100
+
+
+class Resource(object):
+
+    def __init__(self, parent=None, name=''):
+        self.__parent__ = parent
+        self.__name__ = name
+
+
+class Root(Resource):
+    """ tree root """
+
+
+def string_renderer_factory(info):
+    def render(value, system):
+        return '<div class="layout-%s">%s</div>' % (
+            value.get('name', ''), system['content'])
+    return render
+
+
+def has_chameleon():
+    try:
+        __import__('pyramid_chameleon')
+    except ImportError:  # pragma: no cover
+        return False
+    return True
+
+
+class Scenario(object):
+    """Benchmark scenario.
+
+    :param depth: Depth of resource tree
+    :param chain: Number of layouts in chain
+    :param renderer: ``string``, ``chameleon`` or ``slot``
+    :param interfaces: Number of context interfaces with registered layouts
+    :param names: Number of named layouts for each context interface
+    """
+
+    def __init__(self, depth, chain, renderer='string',
+                 interfaces=100, names=10, directory=None):
+        self.depth = depth
+        self.chain = chain
+        self.renderer = renderer
+        self.interfaces = interfaces
+        self.names = names
+        self.directory = directory
+
+    def renderer_name(self, idx):
+        if self.renderer == 'chameleon':
+            return '%s/layout%d.pt' % (self.directory, idx)
+        if self.renderer == 'slot':
+            return 'slot:%s/layout%d.html' % (self.directory, idx)
+        return 'djed-bench'
+
+    def setup(self):
+        config = Configurator(autocommit=True)
+        config.include('djed.layout')
+        config.add_renderer('djed-bench', string_renderer_factory)
+        if self.renderer == 'chameleon':
+            config.include('pyramid_chameleon')
+            for idx in range(self.chain):
+                with open(self.renderer_name(idx), 'w') as f:
+                    f.write(TEMPLATE)
+        elif self.renderer == 'slot':
+            for idx in range(self.chain):
+                with open('%s/layout%d.html' % (self.directory, idx),
+                          'w') as f:
+                    f.write(SLOT_TEMPLATE)
+
+        ifaces = [InterfaceClass('IResource%d' % idx, (Interface,),
+                                 __module__=__name__)
+                  for idx in range(max(self.interfaces, 1))]
+        classes = [implementer(iface)(
+            type('Resource%d' % idx, (Resource,), {}))
+            for idx, iface in enumerate(ifaces)]
+
+        # unrelated layouts, makes registry realistic
+        for iface in ifaces:
+            for idx in range(self.names):
+                config.add_layout(
+                    'layout%d' % idx, context=iface, parent='.',
+                    renderer='djed-bench')
+
+        # chain of site wide layouts, lookup walks whole lineage
+        for idx in range(self.chain):
+            parent = 'chain%d' % (idx + 1) if idx + 1 < self.chain else None
+            config.add_layout(
+                'chain%d' % idx, context=Root, parent=parent,
+                renderer=self.renderer_name(idx),
+                view=lambda context, request, idx=idx: {'name': idx})
+
+        root = Root()
+        context = root
+        for idx in range(self.depth):
+            context = classes[idx % len(classes)](context, 'r%d' % idx)
+
+        self.config = config
+        self.root = root
+        self.context = context
+
+    def request(self):
+        env = prepare(registry=self.config.registry)
+        request = env['request']
+        request.root = self.root
+        request.context = self.context
+        return request, env['closer']
+
+    def measure(self, func, iterations):
+        started = perf_counter()
+        for idx in range(iterations):
+            func()
+        elapsed = perf_counter() - started
+        return iterations / elapsed if elapsed else 0.0
+
+    def run(self, iterations=1000):
+        self.setup()
+        registry = self.config.registry
+        request, closer = self.request()
+        try:
+            return self._run(registry, request, iterations)
+        finally:
+            closer()
+
+    def _run(self, registry, request, iterations):
+        renderer = LayoutRenderer('chain0')
+
+        root = providedBy(self.root)
+        contexts = [providedBy(ctx) for ctx in lineage(self.context)]
+        adapters = registry.adapters
+        index = layout_index(registry)
+
+        def adapter_lookup():
+            # per ancestor multi-adapter lookup
+            for context in contexts:
+                adapters.lookup(
+                    (root, IRequest, context), ILayout, name='chain0')
+
+        def index_lookup():
+            for context in contexts:
+                index.lookup('chain0', root, IRequest, context)
+
+        def lookup():
+            _chain_cache(registry).clear()
+            query_layout_chain(self.root, self.context, request, 'chain0')
+
+        def cached_lookup():
+            query_layout_chain(self.root, self.context, request, 'chain0')
+
+        def render():
+            renderer(CONTENT, self.context, request)
+
+        def render_chunks():
+            renderer.render_chunks(CONTENT.encode(), self.context, request)
+
+        render()
+
+        result = {
+            'depth': self.depth,
+            'chain': self.chain,
+            'renderer': self.renderer,
+            'interfaces': self.interfaces,
+            'names': self.names,
+            'adapter_lookups_per_sec': self.measure(
+                adapter_lookup, iterations),
+            'index_lookups_per_sec': self.measure(index_lookup, iterations),
+            'lookups_per_sec': self.measure(lookup, iterations),
+            'cached_lookups_per_sec': self.measure(cached_lookup, iterations),
+            'renders_per_sec': self.measure(render, iterations),
+            'chunk_renders_per_sec': self.measure(render_chunks, iterations),
+        }
+
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            render()
+            after = tracemalloc.take_snapshot()
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        stats = after.compare_to(before, 'filename')
+        result['retained_blocks'] = sum(
+            max(stat.count_diff, 0) for stat in stats)
+        result['retained_bytes'] = sum(
+            max(stat.size_diff, 0) for stat in stats)
+        result['peak_bytes'] = peak
+
+        return result
+
+
+def registry_memory(layouts=50000, roots=5000, compact=False):
+    """Memory retained by registry with ``layouts`` layouts
+    registered for ``roots`` site roots.
+
+    With ``compact`` introspection data is not stored.
+    """
+    settings = {}
+    if compact:
+        settings['djed.layout.introspection'] = 'false'
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+
+        config = Configurator(settings=settings)
+        config.include('djed.layout')
+        config.add_renderer('djed-bench', string_renderer_factory)
+
+        per_root = max(layouts // max(roots, 1), 1)
+        for idx in range(roots):
+            root = type('Root%d' % idx, (Root,), {})
+            for jdx in range(per_root):
+                config.add_layout(
+                    'layout%d' % jdx, root=root, parent='.',
+                    renderer='djed-bench')
+        config.commit()
+
+        after = tracemalloc.take_snapshot()
+        size, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    return {
+        'layouts': per_root * roots,
+        'roots': roots,
+        'compact': compact,
+        'retained_bytes': sum(max(stat.size_diff, 0) for stat in stats),
+        'peak_bytes': peak,
+    }
+
+
+def run(depths=DEPTHS, chains=CHAINS, renderers=RENDERERS,
+        interfaces=100, names=10, iterations=1000):
+    """ run benchmark scenarios, returns JSON serializable dict """
+    if not has_chameleon():  # pragma: no cover
+        renderers = [r for r in renderers if r != 'chameleon']
+
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for renderer in renderers:
+            for depth in depths:
+                for chain in chains:
+                    scenario = Scenario(
+                        depth, chain, renderer,
+                        interfaces, names, directory)
+                    results.append(scenario.run(iterations))
+    finally:
+        shutil.rmtree(directory)
+
+    info = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'pyramid': pkg_resources.get_distribution('pyramid').version,
+        'results': results,
+    }
+    if resource is not None:
+        info['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return info
+
+
+def main(argv=sys.argv, out=sys.stdout):
+    parser = argparse.ArgumentParser(
+        prog=argv[0], description='Layout rendering benchmarks.')
+    parser.add_argument(
+        '--depth', type=int, nargs='+', default=DEPTHS,
+        help='Resource tree depths')
+    parser.add_argument(
+        '--chain', type=int, nargs='+', default=CHAINS,
+        help='Layout chain lengths')
+    parser.add_argument(
+        '--renderer', nargs='+', default=RENDERERS, choices=RENDERERS,
+        help='Layout renderers')
+    parser.add_argument(
+        '--interfaces', type=int, default=100,
+        help='Number of context interfaces with registered layouts')
+    parser.add_argument(
+        '--names', type=int, default=10,
+        help='Number of named layouts for each context interface')
+    parser.add_argument(
+        '--iterations', type=int, default=1000,
+        help='Number of iterations for each measurement')
+    parser.add_argument(
+        '--layouts', type=int, default=0,
+        help='Measure registry memory with number of layouts')
+    parser.add_argument(
+        '--roots', type=int, default=5000,
+        help='Number of site roots for registry memory measurement')
+
+    args = parser.parse_args(argv[1:])
+
+    info = run(args.depth, args.chain, args.renderer,
+               args.interfaces, args.names, args.iterations)
+
+    if args.layouts:
+        info['registry'] = [
+            registry_memory(args.layouts, args.roots, compact)
+            for compact in (False, True)]
+
+    json.dump(info, out, indent=2, sort_keys=True)
+    out.write('\n')
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
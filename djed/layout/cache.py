@@ -0,0 +1,356 @@
+""" layout caches """
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from zope.interface import Interface, implementer
+from pyramid.exceptions import ConfigurationError
+
+_missing = object()
+
+
+class ILayoutCache(Interface):
+    """ layout output cache backend """
+
+    def get(key, default=None):
+        """ return cached value or default """
+
+    def set(key, value):
+        """ store value """
+
+    def delete(key):
+        """ remove value """
+
+    def clear():
+        """ remove all values """
+
+    def stats():
+        """ return dict with cache statistics """
+
+
+@implementer(ILayoutCache)
+class LRUCache(object):
+    """Thread safe least recently used cache.
+
+    :param max_size: Maximum number of entries
+    :param max_bytes: Maximum total length of values, values must
+        support ``len()``
+    :param on_evict: Callable ``(key, value)``, called for evicted entries
+    """
+
+    def __init__(self, max_size=1000, max_bytes=None, on_evict=None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        evicted = []
+        with self._lock:
+            if self.max_bytes is not None:
+                old = self._data.pop(key, None)
+                if old is not None:
+                    self.bytes -= len(old)
+                if len(value) > self.max_bytes:
+                    return
+                self.bytes += len(value)
+
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size or (
+                    self.max_bytes is not None and
+                    self.bytes > self.max_bytes):
+                key, value = self._data.popitem(last=False)
+                if self.max_bytes is not None:
+                    self.bytes -= len(value)
+                self.evictions += 1
+                evicted.append((key, value))
+
+        if self.on_evict is not None:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def delete(self, key):
+        with self._lock:
+            value = self._data.pop(key, None)
+            if value is not None and self.max_bytes is not None:
+                self.bytes -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {'size': len(self._data),
+                'max_size': self.max_size,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+def memory_cache_factory(settings, prefix='djed.layout.output_cache'):
+    """ create in-process LRU cache from settings """
+    max_bytes = settings.get(prefix + '_max_bytes')
+    return LRUCache(
+        int(settings.get(prefix + '_size', 1000)),
+        int(max_bytes) if max_bytes else None)
+
+
+@implementer(ILayoutCache)
+class FileCache(object):
+    """Cache shared by worker processes, entries are files in directory.
+
+    Directory on tmpfs, e.g. ``/dev/shm/layouts``, is shared by all
+    workers of host. Entries are pickled and published atomically with
+    ``os.replace``. Unpickled entries may run code, so directory is
+    created with ``0o700`` mode, existing directory must be owned by
+    current user and not accessible by others. Every ``check_interval``
+    writes least recently used entries are evicted until cache fits
+    ``max_size`` and ``max_bytes``.
+    Keys must have same ``repr()`` in all processes, errors of storage
+    are counted and treated as misses. Namespaces are caches in
+    dot-prefixed subdirectories, they are not managed by parent cache.
+
+    :param directory: Cache directory
+    :param max_size: Maximum number of entries
+    :param max_bytes: Maximum total size of entries files
+    :param check_interval: Number of writes between evictions
+    """
+
+    def __init__(self, directory, max_size=10000, max_bytes=None,
+                 check_interval=100):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._check_directory()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _check_directory(self):
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            st = os.stat(self.directory)
+        except OSError as exc:
+            raise ConfigurationError(
+                "Can't create cache directory '%s': %s" % (
+                    self.directory, exc))
+
+        if (hasattr(os, 'getuid') and st.st_uid != os.getuid()) or \
+                st.st_mode & 0o077:
+            raise ConfigurationError(
+                "Cache directory '%s' must be owned by current user and "
+                "not accessible by others" % self.directory)
+
+    def namespace(self, name):
+        """ cache in ``.<name>`` subdirectory of cache directory """
+        return self.__class__(
+            os.path.join(self.directory, '.%s' % name),
+            self.max_size, self.max_bytes, self.check_interval)
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                stored, value = pickle.load(f)
+        except FileNotFoundError:
+            self._count('misses')
+            return default
+        except Exception:
+            self._count('errors')
+            self._count('misses')
+            return default
+
+        if stored != repr(key):
+            self._count('misses')
+            return default
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self._count('hits')
+        return value
+
+    def set(self, key, value):
+        try:
+            data = pickle.dumps((repr(key), value), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            self._count('errors')
+            return
+
+        path = self._path(key)
+        tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            self._count('errors')
+            return
+
+        with self._lock:
+            self._writes += 1
+            check = not self._writes % self.check_interval
+
+        if check:
+            self.evict()
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def _entries(self):
+        try:
+            dirs = os.listdir(self.directory)
+        except OSError:
+            return
+
+        for name in dirs:
+            if name.startswith('.'):
+                continue
+            subdir = os.path.join(self.directory, name)
+            try:
+                files = os.listdir(subdir)
+            except OSError:
+                continue
+            for fname in files:
+                if fname.endswith('.tmp'):
+                    continue
+                path = os.path.join(subdir, fname)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """ remove least recently used entries exceeding limits """
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+
+        size = len(entries)
+        total = sum(st.st_size for _, st in entries)
+        for path, st in entries:
+            if size <= self.max_size and (
+                    self.max_bytes is None or total <= self.max_bytes):
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            size -= 1
+            total -= st.st_size
+            self._count('evictions')
+
+    def clear(self):
+        for path, st in list(self._entries()):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        entries = list(self._entries())
+        return {'size': len(entries),
+                'max_size': self.max_size,
+                'bytes': sum(st.st_size for _, st in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'errors': self.errors,
+                'directory': self.directory}
+
+
+@implementer(ILayoutCache)
+class TieredCache(object):
+    """In-process cache in front of shared cache.
+
+    Misses of ``local`` cache are looked up in ``shared`` cache,
+    found values are copied to ``local`` cache.
+    """
+
+    def __init__(self, local, shared):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _missing)
+        if value is _missing:
+            value = self.shared.get(key, _missing)
+            if value is _missing:
+                return default
+            self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        self.shared.set(key, value)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def stats(self):
+        return {'local': self.local.stats(),
+                'shared': self.shared.stats()}
+
+
+def file_cache_factory(settings, prefix='djed.layout.output_cache'):
+    """ create cache shared by worker processes from settings,
+    ``<prefix>_directory`` setting is required """
+    directory = settings.get(prefix + '_directory')
+    if not directory:
+        raise ConfigurationError(
+            "'%s_directory' setting is required" % prefix)
+
+    max_bytes = settings.get(prefix + '_max_bytes')
+    return FileCache(
+        directory,
+        int(settings.get(prefix + '_size', 10000)),
+        int(max_bytes) if max_bytes else None,
+        int(settings.get(prefix + '_check_interval', 100)))
@@ -0,0 +1,114 @@
+""" lazy layout data providers """
+import threading
+from collections import OrderedDict
+from pyramid.registry import Introspectable
+
+LAYOUT_DATA_ID = 'djed:layout-data'
+
+_missing = object()
+
+
+class lazy_data(object):
+    """Lazy layout data value.
+
+    Proxy for value of ``factory()``, factory is called on first access
+    to value, result is memoized.
+    """
+
+    __slots__ = ('_factory', '_value', '_lock')
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = _missing
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._value is _missing:
+            with self._lock:
+                if self._value is _missing:
+                    self._value = self._factory()
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __repr__(self):
+        if self._value is _missing:
+            return '<lazy_data %r>' % (self._factory,)
+        return repr(self._value)
+
+
+def _proxy(name):
+    def method(self, *args):
+        return getattr(self._resolve(), name)(*args)
+    method.__name__ = name
+    return method
+
+
+for _name in ('__str__', '__bytes__', '__bool__', '__len__', '__iter__',
+              '__reversed__', '__contains__', '__getitem__', '__call__',
+              '__hash__', '__eq__', '__ne__', '__lt__', '__le__', '__gt__',
+              '__ge__', '__int__', '__float__', '__index__', '__add__',
+              '__radd__', '__sub__', '__rsub__', '__mul__', '__rmul__',
+              '__mod__', '__rmod__', '__truediv__', '__floordiv__',
+              '__neg__', '__format__'):
+    setattr(lazy_data, _name, _proxy(_name))
+
+
+def _providers(registry):
+    try:
+        return registry._djed_layout_providers
+    except AttributeError:
+        providers = registry._djed_layout_providers = {}
+        return providers
+
+
+def install_providers(registry, data, layout, context, request):
+    """ add lazy values of layout data providers to ``data``,
+    global providers are installed for None layout. Names already
+    in ``data`` are kept, so values set by views and memoized
+    values of providers are not replaced """
+    providers = _providers(registry).get(layout)
+    if not providers:
+        return
+
+    for name, provider in providers.items():
+        if name in data:
+            continue
+        if context is None and layout is None:
+            factory = (lambda provider=provider:
+                       provider(getattr(request, 'context', None), request))
+        else:
+            factory = (lambda provider=provider:
+                       provider(context, request))
+        data[name] = lazy_data(factory)
+
+
+def add_layout_data_provider(cfg, name, provider, layout=None):
+    """Registers lazy layout data provider.
+
+    Provider is called with ``(context, request)`` when template
+    first accesses ``name`` value of layout data, result is memoized
+    for request.
+
+    :param name: Layout data name
+    :param provider: Callable, may be dotted name
+    :param layout: Layout name, provider is available for this layout
+        and its parents. None means provider is available for
+        all layouts. Provider does not replace value already set
+        in layout data, e.g. by view or global provider.
+    """
+    provider = cfg.maybe_dotted(provider)
+
+    discr = (LAYOUT_DATA_ID, name, layout)
+
+    intr = Introspectable(LAYOUT_DATA_ID, discr, name, LAYOUT_DATA_ID)
+    intr['name'] = name
+    intr['provider'] = provider
+    intr['layout'] = layout
+
+    def register():
+        providers = _providers(cfg.registry)
+        providers.setdefault(layout, OrderedDict())[name] = provider
+
+    cfg.action(discr, register, introspectables=(intr,))
@@ -0,0 +1,304 @@
+"""HTML whitespace minification.
+
+Runs of whitespace are collapsed to single space, or to new line
+if run contains new line. Content of ``pre``, ``textarea``, ``script``
+and ``style`` elements, quoted attribute values and comments are not
+changed. Minifier works on UTF-8 encoded chunks, state is kept between
+chunks.
+
+With ``djed.layout.minify`` setting layout tween minifies layouts
+output, minified layout fragments are memoized, so per request only
+view output is minified.
+"""
+import re
+import threading
+from time import perf_counter
+
+from djed.layout.cache import LRUCache
+
+WHITESPACE = b' \t\n\r\f'
+
+WS_RE = re.compile(b'[' + re.escape(WHITESPACE) + b']+')
+
+RAW_OPEN_RE = re.compile(
+    br'<(pre|textarea|script|style)(?=[\s/>])', re.I)
+
+RAW_CLOSE_RE = {
+    tag: re.compile(br'</' + tag + br'\s*>', re.I)
+    for tag in (b'pre', b'textarea', b'script', b'style')}
+
+TAG_START_RE = re.compile(br'<[A-Za-z/!?]')
+
+TAG_STOP_RE = re.compile(br'[>"\']')
+
+# longest tag prefix which may be split between chunks, '</textarea '
+MAX_PARTIAL = 12
+
+# bytes after '<' needed to recognize comment or raw text element
+LOOKAHEAD = 10
+
+COMMENT = ('comment',)
+
+
+def _collapse(match):
+    return b'\n' if b'\n' in match.group() else b' '
+
+
+def collapse(data):
+    """ collapse whitespace runs of text """
+    return WS_RE.sub(_collapse, data)
+
+
+class Minifier(object):
+    """Streaming minifier.
+
+    ``raw`` is state of minifier: None in text, name of raw text
+    element, or tuple inside of tag, attribute value or comment.
+
+    :param raw: State of minifier, if it starts inside of element
+    """
+
+    def __init__(self, raw=None):
+        self.raw = raw
+        self._pending = b''
+
+    def _held(self, buf, pos):
+        # start of possible partial tag at end of buffer
+        lt = buf.rfind(b'<', max(pos, len(buf) - MAX_PARTIAL))
+        if lt != -1 and buf.find(b'>', lt) == -1:
+            return lt
+        return len(buf)
+
+    def _collapsed(self, out, text, final):
+        # trailing whitespace may continue in next chunk
+        if final:
+            out.append(collapse(text))
+            return b''
+        stripped = text.rstrip(WHITESPACE)
+        out.append(collapse(stripped))
+        return text[len(stripped):]
+
+    def _text(self, buf, pos, out, final):
+        lt = buf.find(b'<', pos)
+        if lt == -1:
+            self._pending = self._collapsed(out, buf[pos:], final)
+            return len(buf)
+
+        out.append(collapse(buf[pos:lt]))
+        if not final and len(buf) - lt < LOOKAHEAD:
+            self._pending = buf[lt:]
+            return len(buf)
+
+        if buf.startswith(b'<!--', lt):
+            out.append(b'<!--')
+            self.raw = COMMENT
+            return lt + 4
+
+        match = RAW_OPEN_RE.match(buf, lt)
+        if match is not None:
+            out.append(match.group())
+            self.raw = ('tag', match.group(1).lower())
+            return match.end()
+
+        if TAG_START_RE.match(buf, lt):
+            self.raw = ('tag', None)
+        out.append(b'<')
+        return lt + 1
+
+    def _tag(self, buf, pos, out, final):
+        match = TAG_STOP_RE.search(buf, pos)
+        if match is None:
+            self._pending = self._collapsed(out, buf[pos:], final)
+            return len(buf)
+
+        out.append(collapse(buf[pos:match.start()]))
+        out.append(match.group())
+        if match.group() == b'>':
+            self.raw = self.raw[1]
+        else:
+            self.raw = ('quote', match.group(), self.raw[1])
+        return match.end()
+
+    def _quote(self, buf, pos, out, final):
+        end = buf.find(self.raw[1], pos)
+        if end == -1:
+            out.append(buf[pos:])
+            return len(buf)
+
+        out.append(buf[pos:end + 1])
+        self.raw = ('tag', self.raw[2])
+        return end + 1
+
+    def _comment(self, buf, pos, out, final):
+        end = buf.find(b'-->', pos)
+        if end == -1:
+            # '--' of end marker may be split between chunks
+            keep = len(buf) if final else max(pos, len(buf) - 2)
+            out.append(buf[pos:keep])
+            self._pending = buf[keep:]
+            return len(buf)
+
+        out.append(buf[pos:end + 3])
+        self.raw = None
+        return end + 3
+
+    def _raw(self, buf, pos, out, final):
+        match = RAW_CLOSE_RE[self.raw].search(buf, pos)
+        if match is None:
+            end = len(buf) if final else self._held(buf, pos)
+            out.append(buf[pos:end])
+            self._pending = buf[end:]
+            return len(buf)
+
+        out.append(buf[pos:match.end()])
+        self.raw = None
+        return match.end()
+
+    def _process(self, data, final):
+        buf = self._pending + data
+        self._pending = b''
+        out = []
+        pos = 0
+
+        while pos < len(buf):
+            raw = self.raw
+            if raw is None:
+                pos = self._text(buf, pos, out, final)
+            elif isinstance(raw, bytes):
+                pos = self._raw(buf, pos, out, final)
+            elif raw[0] == 'tag':
+                pos = self._tag(buf, pos, out, final)
+            elif raw[0] == 'quote':
+                pos = self._quote(buf, pos, out, final)
+            else:
+                pos = self._comment(buf, pos, out, final)
+
+        return b''.join(out)
+
+    def feed(self, data):
+        return self._process(data, False)
+
+    def flush(self):
+        """ remaining output """
+        return self._process(b'', True)
+
+
+def minify(data, raw=None):
+    """ minify bytes, returns minified bytes and raw element name
+    at end of data """
+    minifier = Minifier(raw)
+    data = minifier.feed(data) + minifier.flush()
+    return data, minifier.raw
+
+
+def minify_text(text, raw=None):
+    """ minify text, see :func:`minify` """
+    data, raw = minify(text.encode('utf-8'), raw)
+    return data.decode('utf-8'), raw
+
+
+class Minified(object):
+    """ memoized minified fragment, its length is size of
+    source and minified data """
+
+    __slots__ = ('source', 'data', 'raw')
+
+    def __init__(self, source, data, raw):
+        self.source = source
+        self.data = data
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.source) + len(self.data)
+
+
+class MinifyStage(object):
+    """Layout output minification with memoized fragments.
+
+    Heads of layouts which are not cacheable may differ for every
+    request, so memoized fragments are limited by size too.
+
+    :param size: Number of memoized minified fragments
+    :param max_bytes: Maximum total size of memoized fragments
+    """
+
+    def __init__(self, size=1000, max_bytes=4 * 1024 * 1024):
+        self.fragments = LRUCache(size, max_bytes)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _count(self, size_in, size_out, seconds):
+        with self._lock:
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+            self.seconds += seconds
+
+    def fragment(self, data, raw=None):
+        """ minified layout fragment, memoized """
+        started = perf_counter()
+        key = (raw, data)
+        result = self.fragments.get(key)
+        if result is None:
+            result = Minified(data, *minify(data, raw))
+            self.fragments.set(key, result)
+        self._count(len(data), len(result.data), perf_counter() - started)
+        return result.data, result.raw
+
+    def chunks(self, heads, app_iter, tails):
+        """ iterate over minified heads, content and tails """
+        raw = None
+        try:
+            for chunk in heads:
+                chunk, raw = self.fragment(chunk, raw)
+                yield chunk
+
+            minifier = Minifier(raw)
+            for chunk in app_iter:
+                started = perf_counter()
+                data = minifier.feed(chunk)
+                self._count(len(chunk), len(data), perf_counter() - started)
+                if data:
+                    yield data
+            data = minifier.flush()
+            self._count(0, len(data), 0)
+            if data:
+                yield data
+
+            raw = minifier.raw
+            for chunk in tails:
+                chunk, raw = self.fragment(chunk, raw)
+                yield chunk
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                close()
+
+    def stats(self):
+        fragments = self.fragments.stats()
+        return {'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'bytes_saved': self.bytes_in - self.bytes_out,
+                'seconds': self.seconds,
+                'fragment_hits': fragments['hits'],
+                'fragment_misses': fragments['misses']}
+
+
+def minify_stage(registry):
+    """ minification stage of registry """
+    try:
+        return registry._djed_layout_minify
+    except AttributeError:
+        settings = registry.settings or {}
+        stage = registry._djed_layout_minify = MinifyStage(
+            int(settings.get('djed.layout.minify_cache_size', 1000)),
+            int(settings.get('djed.layout.minify_cache_max_bytes',
+                             4 * 1024 * 1024)))
+        return stage
+
+
+def minify_stats(registry):
+    """ minification counters: input and output bytes, saved bytes,
+    time spent and memoized fragments hits """
+    return minify_stage(registry).stats()
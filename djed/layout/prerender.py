@@ -0,0 +1,216 @@
+"""Static pre-rendering.
+
+Renders pages of application through views and layout tween and writes
+output to directory for serving by static server::
+
+    $ djed-layout-prerender development.ini public / /about --gzip
+
+Paths are taken from command line, ``--route`` names and
+``djed.layout.prerender_paths`` setting. Run is incremental: entity
+tags and output digests are stored in manifest, with
+``djed.layout.etag`` enabled pages with unchanged view output and
+layout templates are answered with ``304 Not Modified`` and skipped,
+unchanged output is not rewritten.
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import hashlib
+import argparse
+import multiprocessing
+from collections import OrderedDict
+from pyramid.httpexceptions import HTTPException
+from pyramid.paster import get_app, setup_logging
+from pyramid.request import Request
+from pyramid.scripting import prepare
+
+MANIFEST = '.djed-prerender.json'
+
+# worker process state, set by pool initializer
+_worker = {}
+
+
+def output_path(path):
+    """ file name for request path, relative to output directory """
+    path = path.split('?', 1)[0].strip('/')
+    if not path:
+        return 'index.html'
+    if os.path.splitext(path.rsplit('/', 1)[-1])[1]:
+        return path
+    return '%s/index.html' % path
+
+
+def _write(filename, body):
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname, exist_ok=True)
+
+    tmp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(body)
+    os.replace(tmp, filename)
+
+
+def _compress(body):
+    """ gzip compressed body, without timestamp for stable output """
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as f:
+        f.write(body)
+    return buf.getvalue()
+
+
+def render_page(app, path, directory, entry=None,
+                compress=False, url='http://localhost'):
+    """Render page and write output.
+
+    Returns ``(path, status, entry)``, status is ``written``,
+    ``unchanged``, ``not-modified`` or ``error``.
+    """
+    entry = dict(entry or ())
+
+    filename = os.path.join(directory, output_path(path))
+    exists = os.path.exists(filename) and \
+        (not compress or os.path.exists(filename + '.gz'))
+
+    request = Request.blank(path, base_url=url)
+    if exists and entry.get('etag'):
+        request.headers['If-None-Match'] = entry['etag']
+
+    try:
+        response = request.get_response(app)
+    except HTTPException as exc:
+        response = exc
+
+    if response.status_int == 304:
+        return path, 'not-modified', entry
+
+    if response.status_int != 200:
+        return path, 'error', {'status': response.status}
+
+    body = response.body
+    digest = hashlib.sha1(body).hexdigest()
+    etag = response.headers.get('ETag')
+
+    if exists and digest == entry.get('sha1'):
+        return path, 'unchanged', {'etag': etag, 'sha1': digest}
+
+    _write(filename, body)
+    if compress:
+        _write(filename + '.gz', _compress(body))
+
+    return path, 'written', {'etag': etag, 'sha1': digest}
+
+
+def _init_worker(app, directory, compress, url):
+    _worker.update(app=app, directory=directory, compress=compress, url=url)
+
+
+def _render_worker(task):
+    path, entry = task
+    return render_page(
+        _worker['app'], path, _worker['directory'],
+        entry, _worker['compress'], _worker['url'])
+
+
+def load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_manifest(directory, manifest):
+    _write(os.path.join(directory, MANIFEST),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+
+def route_paths(app, names):
+    """ paths of routes without replacement markers """
+    env = prepare(registry=app.registry)
+    try:
+        request = env['request']
+        return [request.route_path(name) for name in names]
+    finally:
+        env['closer']()
+
+
+def prerender(app, paths, directory, compress=False, processes=1,
+              url='http://localhost', force=False):
+    """Render ``paths`` of WSGI application to ``directory``.
+
+    Returns list of ``(path, status, entry)`` results, manifest
+    in ``directory`` is updated.
+    """
+    manifest = {} if force else load_manifest(directory)
+    tasks = [(path, manifest.get(path)) for path in paths]
+
+    if processes > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        # application is inherited by forked workers
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(processes, initializer=_init_worker,
+                      initargs=(app, directory, compress, url)) as pool:
+            results = pool.map(_render_worker, tasks)
+    else:
+        results = [render_page(app, path, directory, entry, compress, url)
+                   for path, entry in tasks]
+
+    for path, status, entry in results:
+        if status == 'error':
+            manifest.pop(path, None)
+        else:
+            manifest[path] = entry
+
+    save_manifest(directory, manifest)
+    return results
+
+
+def main(argv=sys.argv, out=sys.stdout):
+    parser = argparse.ArgumentParser(
+        prog=argv[0], description='Pre-render layout wrapped pages.')
+    parser.add_argument('config_uri', help='Application ini file')
+    parser.add_argument('directory', help='Output directory')
+    parser.add_argument('paths', nargs='*', help='Request paths')
+    parser.add_argument(
+        '--route', action='append', default=[],
+        help='Route name, route pattern must not have replacement markers')
+    parser.add_argument(
+        '--app', default='main', help='Application name in ini file')
+    parser.add_argument(
+        '--url', default='http://localhost', help='Application base url')
+    parser.add_argument(
+        '--gzip', action='store_true', help='Write pre-compressed files')
+    parser.add_argument(
+        '--processes', type=int, default=os.cpu_count() or 1,
+        help='Number of worker processes')
+    parser.add_argument(
+        '--force', action='store_true', help='Ignore manifest')
+
+    args = parser.parse_args(argv[1:])
+
+    setup_logging(args.config_uri)
+    app = get_app(args.config_uri, args.app)
+
+    paths = list(args.paths)
+    paths.extend(route_paths(app, args.route))
+    paths.extend(
+        app.registry.settings.get('djed.layout.prerender_paths', ()))
+
+    paths = list(OrderedDict.fromkeys(paths))
+
+    results = prerender(app, paths, args.directory, args.gzip,
+                        args.processes, args.url, args.force)
+
+    errors = 0
+    for path, status, entry in results:
+        out.write('%s %s\n' % (status, path))
+        if status == 'error':
+            errors += 1
+
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""Slot renderer for simple layouts.
+
+Static HTML with ``${name}`` placeholders::
+
+    config.add_layout('', renderer='slot:templates/layout.html')
+
+Template is compiled once to list of literal segments and
+placeholders. ``${content}`` is replaced with wrapped content,
+other names are looked up in layout data and HTML escaped,
+``${structure:name}`` inserts value without escaping.
+"""
+import os
+import re
+from html import escape
+from pyramid.exceptions import ConfigurationError
+from pyramid.path import AssetResolver
+
+from djed.layout.minify import Minifier
+
+SLOT_PREFIX = 'slot:'
+
+SLOT_RE = re.compile(r'\$\{\s*(structure:\s*)?([A-Za-z_]\w*)\s*\}')
+
+
+def _escape(value):
+    if value is None:
+        return ''
+    html = getattr(value, '__html__', None)
+    if html is not None:
+        return html()
+    return escape(str(value))
+
+
+class SlotTemplate(object):
+    """Compiled slot template.
+
+    ``segments`` is list of literal strings, placeholders are
+    ``(index, name, structure)`` tuples of ``slots``, their segments
+    are replaced on render.
+    """
+
+    __slots__ = ('segments', 'slots')
+
+    def __init__(self, source, minify=False):
+        self.segments = []
+        self.slots = []
+
+        pos = 0
+        for match in SLOT_RE.finditer(source):
+            self.segments.append(source[pos:match.start()])
+            self.slots.append(
+                (len(self.segments), match.group(2), bool(match.group(1))))
+            self.segments.append(None)
+            pos = match.end()
+        self.segments.append(source[pos:])
+
+        if minify:
+            self.minify()
+
+    def minify(self):
+        """ minify literal segments, content of raw text elements
+        is kept across placeholders """
+        minifier = Minifier()
+        for idx, segment in enumerate(self.segments):
+            if segment is not None:
+                data = minifier.feed(segment.encode('utf-8'))
+                data += minifier.flush()
+                self.segments[idx] = data.decode('utf-8')
+
+    def render(self, data, content):
+        out = list(self.segments)
+        for idx, name, structure in self.slots:
+            if name == 'content':
+                out[idx] = content
+                continue
+            try:
+                value = data[name]
+            except KeyError:
+                raise NameError(name)
+            if not structure:
+                out[idx] = _escape(value)
+            elif value is not None:
+                out[idx] = str(value)
+            else:
+                out[idx] = ''
+        return ''.join(out)
+
+
+class SlotRenderer(object):
+    """Layout renderer for slot templates.
+
+    :param name: Asset spec or path of template
+    :param package: Package for relative template paths
+    :param minify: Minify literal segments of template
+    """
+
+    def __init__(self, name, package=None, minify=False):
+        self.name = name
+        self.package = package
+        self.minify = minify
+
+        try:
+            self.path = AssetResolver(package).resolve(name).abspath()
+            self.template = self.load()
+        except (IOError, ValueError, ImportError) as exc:
+            raise ConfigurationError(
+                "Can't load slot template '%s': %s" % (name, exc))
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            self.mtime = os.fstat(f.fileno()).st_mtime
+            return SlotTemplate(f.read(), self.minify)
+
+    def _template(self, request):
+        registry = getattr(request, 'registry', None)
+        if registry is not None and \
+                (registry.settings or {}).get('reload_templates'):
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                mtime = self.mtime
+            if mtime != self.mtime:
+                self.template = self.load()
+        return self.template
+
+    def render_slots(self, value, content, request):
+        """ render template, without system values """
+        return self._template(request).render(value, content)
+
+    def render(self, value, system, request=None):
+        return self.render_slots(value, system['content'], request)
+
+
+def slot_renderer(registry, name, package=None):
+    """ slot renderer, shared by layouts with same template """
+    try:
+        renderers = registry._djed_layout_slots
+    except AttributeError:
+        renderers = registry._djed_layout_slots = {}
+
+    key = (name, package)
+    try:
+        return renderers[key]
+    except KeyError:
+        settings = registry.settings or {}
+        renderer = renderers[key] = SlotRenderer(
+            name, package, bool(settings.get('djed.layout.minify')))
+        return renderer
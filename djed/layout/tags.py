@@ -0,0 +1,186 @@
+"""Tag based invalidation of cached layout output.
+
+Cached fragments and pages are stored with versions of their tags.
+Layout views declare tags and ttl with ``request.set_layout_cache()``,
+every entry is also tagged with layout name and root. Invalidation
+replaces tag versions, entries with old versions are treated
+as misses. Tag versions are stored in ``djed.layout.cache_tags_backend``
+cache, with shared backend invalidation is visible to all workers.
+By default versions are stored in namespace of shared fragments or
+output cache, if it supports namespaces, e.g. ``FileCache``, otherwise
+in process.
+"""
+import time
+import uuid
+from pyramid.compat import string_types
+
+from djed.layout.cache import TieredCache
+from djed.layout.cache import memory_cache_factory
+
+TAG_ID = 'djed:layout-tag'
+
+
+def layout_tag(name):
+    """ tag of layout output """
+    return 'layout:%s' % name
+
+
+def root_tag(root):
+    """ tag of output rendered for root, root is identified
+    by class and ``__name__`` """
+    cls = root.__class__
+    return 'root:%s.%s:%s' % (
+        cls.__module__, cls.__name__, getattr(root, '__name__', '') or '')
+
+
+class Tagged(object):
+    """ cached value with tag versions and expiration time """
+
+    __slots__ = ('value', 'versions', 'expires')
+
+    def __init__(self, value, versions, expires=None):
+        self.value = value
+        self.versions = versions
+        self.expires = expires
+
+    def __len__(self):
+        return len(self.value)
+
+
+def _shared_versions(registry):
+    """ tag versions namespace of shared fragments or output cache """
+    from djed.layout import _fragment_cache, get_output_cache
+
+    for cache in (_fragment_cache(registry), get_output_cache(registry)):
+        if isinstance(cache, TieredCache):
+            cache = cache.shared
+        namespace = getattr(cache, 'namespace', None)
+        if namespace is not None:
+            return namespace('tags')
+    return None
+
+
+def tag_versions(registry):
+    """ cache of tag versions, created by
+    ``djed.layout.cache_tags_backend`` factory, shared with
+    fragments or output cache by default """
+    try:
+        return registry._djed_layout_tag_versions
+    except AttributeError:
+        settings = registry.settings or {}
+        factory = settings.get('djed.layout.cache_tags_backend')
+        if factory is not None:
+            cache = factory(settings, 'djed.layout.cache_tags')
+        else:
+            cache = _shared_versions(registry)
+            if cache is None:
+                cache = memory_cache_factory(
+                    settings, 'djed.layout.cache_tags')
+
+        registry._djed_layout_tag_versions = cache
+        return cache
+
+
+def _version(versions, tag):
+    version = versions.get((TAG_ID, tag))
+    if version is None:
+        # unknown or evicted tag, entries with previous version
+        # must not become valid again
+        version = uuid.uuid4().hex
+        versions.set((TAG_ID, tag), version)
+    return version
+
+
+def request_tags(request):
+    """ tags and ttl declared by layout views of request """
+    return (getattr(request, '_layout_cache_tags', ()),
+            getattr(request, '_layout_cache_ttl', None))
+
+
+def set_layout_cache(request, *tags, ttl=None):
+    """Declare cache tags and ttl of layout data.
+
+    Called by layout views, cached output of request is invalidated by
+    any of ``tags`` and expires after minimal declared ``ttl`` seconds.
+    """
+    try:
+        request._layout_cache_tags.update(tags)
+    except AttributeError:
+        request._layout_cache_tags = set(tags)
+
+    if ttl is not None:
+        current = getattr(request, '_layout_cache_ttl', None)
+        request._layout_cache_ttl = ttl if current is None \
+            else min(current, ttl)
+
+
+def store(cache, key, value, request, tags):
+    """ store value in cache with versions of ``tags`` and tags
+    declared by request """
+    declared, ttl = request_tags(request)
+    tags = set(tags)
+    tags.update(declared)
+
+    versions = tag_versions(request.registry)
+    cache.set(key, Tagged(
+        value,
+        tuple((tag, _version(versions, tag)) for tag in sorted(tags)),
+        time.time() + ttl if ttl is not None else None))
+
+
+def lookup(cache, key, registry, default=None):
+    """ cached value, entries with changed tags or expired
+    entries are deleted """
+    entry = cache.get(key)
+    if not isinstance(entry, Tagged):
+        return default
+
+    valid = entry.expires is None or entry.expires > time.time()
+    if valid:
+        versions = tag_versions(registry)
+        for tag, version in entry.versions:
+            if versions.get((TAG_ID, tag)) != version:
+                valid = False
+                break
+
+    if not valid:
+        cache.delete(key)
+        return default
+
+    return entry.value
+
+
+def invalidate_layouts(registry, tags=(), layout=None, root=None):
+    """Invalidate cached layout output.
+
+    :param tags: Tags declared by layout views
+    :param layout: Layout name or list of names
+    :param root: Root object or list of roots
+    """
+    if isinstance(tags, string_types):
+        tags = (tags,)
+    tags = list(tags)
+
+    if layout is not None:
+        if isinstance(layout, string_types):
+            layout = (layout,)
+        tags.extend(layout_tag(name) for name in layout)
+
+    if root is not None:
+        if not isinstance(root, (list, tuple)):
+            root = (root,)
+        tags.extend(root_tag(r) for r in root)
+
+    versions = tag_versions(registry)
+    for tag in tags:
+        versions.set((TAG_ID, tag), uuid.uuid4().hex)
+
+
+def invalidate_layouts_directive(cfg, tags=(), layout=None, root=None):
+    """ config directive, see :func:`invalidate_layouts` """
+    invalidate_layouts(cfg.registry, tags, layout, root)
+
+
+def invalidate_layouts_request(request, tags=(), layout=None, root=None):
+    """ request method, see :func:`invalidate_layouts` """
+    invalidate_layouts(request.registry, tags, layout, root)
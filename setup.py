@@ -18,8 +18,9 @@ setup(
         "Intended Audience :: Developers",
         "License :: OSI Approved :: ISC License (ISCL)",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 3.3",
-        "Programming Language :: Python :: 3.4",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
         "Topic :: Internet :: WWW/HTTP",
     ],
     author='Djed developers',
@@ -28,6 +29,7 @@ setup(
     license='ISC License (ISCL)',
     keywords='web pyramid pylons',
     packages=['djed.layout'],
+    python_requires='>=3.7',
     include_package_data=True,
     install_requires=[
         'pyramid',
@@ -39,4 +41,10 @@ setup(
         ],
     },
     test_suite='nose.collector',
+    entry_points={
+        'console_scripts': [
+            'djed-layout-bench = djed.layout.bench:main',
+            'djed-layout-prerender = djed.layout.prerender:main',
+        ],
+    },
 )
@@ -0,0 +1,133 @@
+""" asyncio layout tests """
+import asyncio
+from unittest import mock
+from pyramid.response import Response
+
+from djed.testing import BaseTestCase
+
+from djed.layout.aio import AsyncLayoutRenderer
+from djed.layout.aio import async_layout_tween_factory
+
+
+class Context(object):
+    __name__ = ''
+
+    def __init__(self, parent=None):
+        self.__parent__ = parent
+
+
+class AsyncRenderer(object):
+
+    def render(self, value, system, request):
+        async def render():
+            await asyncio.sleep(0)
+            return '<section>%s</section>' % system['content']
+        return render()
+
+
+class TestAsyncLayout(BaseTestCase):
+
+    _includes = ('djed.layout', 'pyramid_chameleon')
+
+    def test_async_renderer(self):
+        events = []
+
+        async def l1(context, request):
+            events.append('l1 start')
+            await asyncio.sleep(0)
+            events.append('l1 end')
+            return {'name': 'l1'}
+
+        class L2(object):
+            def __init__(self, context, request):
+                pass
+
+            async def __call__(self):
+                events.append('l2 start')
+                await asyncio.sleep(0)
+                events.append('l2 end')
+                return {'name': 'l2'}
+
+        self.config.add_layout(
+            'l1', parent='l2', view=l1, renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l2', view=L2, renderer=AsyncRenderer())
+
+        rendr = AsyncLayoutRenderer('l1')
+        res = asyncio.run(rendr('View: test', Context(), self.request))
+
+        self.assertEqual(
+            res, '<section><div>View: test</div>\n</section>')
+        self.assertEqual(
+            events, ['l1 start', 'l2 start', 'l1 end', 'l2 end'])
+        self.assertEqual(self.request.layout_data['name'], 'l2')
+
+    def test_async_renderer_no_layouts(self):
+        rendr = AsyncLayoutRenderer('test')
+        res = asyncio.run(rendr('View: test', Context(), self.request))
+
+        self.assertEqual(res, 'View: test')
+
+    def test_async_tween(self):
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+
+        async def handler(request):
+            return Response('View: test')
+
+        self.request.layout = 'test'
+        self.request.context = Context()
+
+        tween = async_layout_tween_factory(handler, self.registry)
+        response = asyncio.run(tween(self.request))
+
+        self.assertEqual(response.text, '<div>View: test</div>\n')
+
+    def test_async_renderer_cacheable(self):
+        self.config.add_layout(
+            'test', renderer=AsyncRenderer(), cacheable=True)
+
+        rendr = AsyncLayoutRenderer('test')
+        with mock.patch.object(
+                rendr, 'render_layout', wraps=rendr.render_layout) as m:
+            res1 = asyncio.run(rendr('View: 1', Context(), self.request))
+            res2 = asyncio.run(rendr('View: 2', Context(), self.request))
+
+        self.assertEqual(res1, '<section>View: 1</section>')
+        self.assertEqual(res2, '<section>View: 2</section>')
+        self.assertEqual(m.call_count, 1)
+
+    def test_async_renderer_debug(self):
+        self.registry.settings['djed.layout.debug'] = True
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+
+        rendr = AsyncLayoutRenderer('test')
+        with mock.patch.object(rendr, 'layout_info') as m:
+            res = asyncio.run(rendr('<p>View</p>', Context(), self.request))
+            self.assertFalse(m.called)
+
+        self.assertIn('<!-- layout:', res)
+        self.assertTrue(res.endswith('<div><p>View</p></div>\n</div>'))
+
+    def test_async_renderer_concurrent_views(self):
+        self.registry.settings['djed.layout.concurrent_views'] = 2
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt',
+            view=lambda context, request: {'name': 'test'})
+
+        rendr = AsyncLayoutRenderer('test')
+        chunks = rendr.render_chunks(b'View', Context(), self.request)
+
+        self.assertEqual(b''.join(chunks), b'<div>View</div>\n')
+        self.assertEqual(self.request.layout_data['name'], 'test')
+
+    def test_async_tween_unsupported_settings(self):
+        from pyramid.exceptions import ConfigurationError
+
+        self.registry.settings['djed.layout.stream'] = True
+        self.registry.settings['djed.layout.etag'] = True
+
+        with self.assertRaises(ConfigurationError) as cm:
+            async_layout_tween_factory(None, self.registry)
+        self.assertIn('djed.layout.stream, djed.layout.etag',
+                      str(cm.exception))
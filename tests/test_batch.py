@@ -0,0 +1,118 @@
+""" batch rendering tests """
+import os
+from unittest import mock
+from zope.interface import implementer, Interface
+
+from djed.testing import BaseTestCase
+
+from djed.layout.batch import chain_key
+from djed.layout.batch import render_batch
+
+
+class IPage(Interface):
+    pass
+
+
+class Root(object):
+    __parent__ = None
+    __name__ = ''
+
+
+class Context(object):
+    def __init__(self, parent, name):
+        self.__parent__ = parent
+        self.__name__ = name
+
+
+@implementer(IPage)
+class Page(Context):
+    pass
+
+
+class TestBatch(BaseTestCase):
+
+    _includes = ('djed.layout', 'pyramid_chameleon')
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+
+        self.config.add_layout(
+            '', context=Root, renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            '', context=IPage, parent='.', renderer='tests:test-layout.pt',
+            view=lambda context, request: {'pid': os.getpid()})
+
+        self.root = Root()
+
+    def _items(self, count):
+        for idx in range(count):
+            cls = Page if idx % 2 else Context
+            context = cls(self.root, 'c%d' % idx)
+            yield 'Content %d' % idx, context
+
+    def test_chain_key(self):
+        key1 = chain_key(self.registry, '', Context(self.root, 'a'))
+        key2 = chain_key(self.registry, '', Page(self.root, 'b'))
+        key3 = chain_key(self.registry, '', Page(self.root, 'c'))
+
+        self.assertNotEqual(key1, key2)
+        self.assertEqual(key2, key3)
+
+    def test_render_group_resolves_chain_once(self):
+        import djed.layout
+        from djed.layout import batch
+
+        items = [('Content %d' % idx, Page(self.root, 'p%d' % idx))
+                 for idx in range(3)]
+
+        query = mock.Mock(wraps=djed.layout.query_layout_chain)
+        with mock.patch.object(djed.layout, 'query_layout_chain', query), \
+                mock.patch.object(batch, 'query_layout_chain', query):
+            results = batch.render_group(self.registry, '', items)
+
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(
+            results[2], '<div><div>Content 2</div>\n</div>\n')
+
+    def test_render_batch(self):
+        results = list(render_batch(
+            self.registry, '', self._items(5), processes=1, window=2))
+
+        self.assertEqual(
+            [context.__name__ for context, _ in results],
+            ['c0', 'c1', 'c2', 'c3', 'c4'])
+        self.assertEqual(results[0][1], '<div>Content 0</div>\n')
+        self.assertEqual(
+            results[1][1], '<div><div>Content 1</div>\n</div>\n')
+
+    def test_render_batch_lazy(self):
+        consumed = []
+
+        def items():
+            for item in self._items(10):
+                consumed.append(item)
+                yield item
+
+        results = render_batch(
+            self.registry, '', items(), processes=1, window=3)
+        next(results)
+        self.assertEqual(len(consumed), 3)
+        results.close()
+
+    def test_render_batch_no_fork_by_default(self):
+        with mock.patch('multiprocessing.get_context') as m:
+            results = list(render_batch(self.registry, '', self._items(3)))
+            self.assertFalse(m.called)
+
+        self.assertEqual(len(results), 3)
+
+    def test_render_batch_processes(self):
+        items = list(self._items(20))
+        results = list(render_batch(
+            self.registry, '', items, root=self.root,
+            processes=2, window=8, chunksize=2))
+
+        self.assertEqual(len(results), 20)
+        for (content, context), (rcontext, html) in zip(items, results):
+            self.assertIs(context, rcontext)
+            self.assertIn(content, html)
@@ -0,0 +1,112 @@
+""" layout benchmarks """
+import io
+import json
+import tracemalloc
+from unittest import TestCase
+from pyramid.response import Response
+
+from djed.testing import BaseTestCase
+
+from djed.layout import layout_tween_factory
+
+
+class Context(object):
+    def __init__(self, parent=None):
+        self.__parent__ = parent
+
+
+class TestBytesAllocations(BaseTestCase):
+
+    _includes = ('djed.layout', 'pyramid_chameleon')
+
+    body = b'<p>content</p>\n' * 32768
+
+    def setUp(self):
+        super(TestBytesAllocations, self).setUp()
+
+        self.config.add_layout(
+            'l1', parent='l2', renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l2', parent='l3', renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l3', renderer='tests:test-layout-html.pt')
+
+        self.request.layout = 'l1'
+        self.request.context = Context()
+
+    def measure(self, bytes_mode):
+        self.registry.settings['djed.layout.bytes'] = bytes_mode
+
+        def handler(request):
+            return Response(body=self.body, content_type='text/html')
+
+        tween = layout_tween_factory(handler, self.registry)
+        tween(self.request)
+
+        tracemalloc.start()
+        try:
+            response = tween(self.request)
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return peak, response.body
+
+    def test_3_level_chain(self):
+        text_peak, text_body = self.measure(False)
+        bytes_peak, bytes_body = self.measure(True)
+
+        self.assertEqual(text_body, bytes_body)
+        self.assertLess(
+            bytes_peak * 4, text_peak,
+            'peak allocations: text %s bytes, bytes mode %s bytes' % (
+                text_peak, bytes_peak))
+
+
+class TestBenchmarkSuite(TestCase):
+
+    def test_run(self):
+        from djed.layout.bench import run
+
+        info = run(depths=(1, 3), chains=(1, 2),
+                   interfaces=5, names=2, iterations=3)
+
+        self.assertEqual(len(info['results']), 12)
+        self.assertEqual(
+            [(r['renderer'], r['depth'], r['chain'])
+             for r in info['results']],
+            [('string', 1, 1), ('string', 1, 2),
+             ('string', 3, 1), ('string', 3, 2),
+             ('chameleon', 1, 1), ('chameleon', 1, 2),
+             ('chameleon', 3, 1), ('chameleon', 3, 2),
+             ('slot', 1, 1), ('slot', 1, 2),
+             ('slot', 3, 1), ('slot', 3, 2)])
+
+        for result in info['results']:
+            self.assertGreater(result['lookups_per_sec'], 0)
+            self.assertGreater(result['adapter_lookups_per_sec'], 0)
+            self.assertGreater(result['index_lookups_per_sec'], 0)
+            self.assertGreater(result['renders_per_sec'], 0)
+            self.assertGreater(result['peak_bytes'], 0)
+
+    def test_registry_memory(self):
+        from djed.layout.bench import registry_memory
+
+        full = registry_memory(layouts=200, roots=20)
+        compact = registry_memory(layouts=200, roots=20, compact=True)
+
+        self.assertEqual(full['layouts'], 200)
+        self.assertEqual(full['roots'], 20)
+        self.assertLess(compact['retained_bytes'], full['retained_bytes'])
+
+    def test_main(self):
+        from djed.layout.bench import main
+
+        out = io.StringIO()
+        main(['djed-layout-bench', '--depth', '2', '--chain', '3',
+              '--renderer', 'string', '--iterations', '2',
+              '--interfaces', '2', '--names', '1'], out)
+
+        info = json.loads(out.getvalue())
+        self.assertEqual(len(info['results']), 1)
+        self.assertEqual(info['results'][0]['chain'], 3)
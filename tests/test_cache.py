@@ -0,0 +1,252 @@
+""" layout cache tests """
+import os
+import time
+import shutil
+import tempfile
+from unittest import mock, TestCase
+from zope.interface.verify import verifyObject
+
+from djed.layout.cache import ILayoutCache
+from djed.layout.cache import LRUCache
+from djed.layout.cache import FileCache
+from djed.layout.cache import TieredCache
+
+
+class TestLRUCache(TestCase):
+
+    def test_interface(self):
+        self.assertTrue(verifyObject(ILayoutCache, LRUCache()))
+
+    def test_get_set(self):
+        cache = LRUCache(2)
+
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b', 2), 2)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['size'], 1)
+
+    def test_evict_least_recently_used(self):
+        cache = LRUCache(2)
+
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_on_evict(self):
+        evicted = []
+        cache = LRUCache(1, on_evict=lambda k, v: evicted.append((k, v)))
+
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        self.assertEqual(evicted, [('a', 1)])
+
+    def test_max_bytes(self):
+        cache = LRUCache(10, max_bytes=5)
+
+        cache.set('a', b'123')
+        cache.set('b', b'45')
+        self.assertEqual(cache.stats()['bytes'], 5)
+
+        cache.set('c', b'6')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 3)
+
+        cache.set('b', b'123456')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['bytes'], 1)
+
+        cache.delete('c')
+        self.assertEqual(cache.stats()['bytes'], 0)
+        self.assertEqual(len(cache), 0)
+
+    def test_clear(self):
+        cache = LRUCache(10, max_bytes=10)
+        cache.set('a', b'1')
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_memory_cache_factory(self):
+        from djed.layout.cache import memory_cache_factory
+
+        cache = memory_cache_factory({})
+        self.assertEqual(cache.max_size, 1000)
+        self.assertIsNone(cache.max_bytes)
+
+        cache = memory_cache_factory({
+            'djed.layout.output_cache_size': '10',
+            'djed.layout.output_cache_max_bytes': '1024'})
+        self.assertEqual(cache.max_size, 10)
+        self.assertEqual(cache.max_bytes, 1024)
+
+
+class TestFileCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_interface(self):
+        self.assertTrue(verifyObject(ILayoutCache, FileCache(self.directory)))
+
+    def test_get_set(self):
+        cache = FileCache(self.directory)
+
+        self.assertIsNone(cache.get(('a', 1)))
+        cache.set(('a', 1), {'value': 1})
+        self.assertEqual(cache.get(('a', 1)), {'value': 1})
+        self.assertEqual(cache.get('b', 2), 2)
+
+        cache.delete(('a', 1))
+        self.assertIsNone(cache.get(('a', 1)))
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['size'], 0)
+
+    def test_shared(self):
+        cache1 = FileCache(self.directory)
+        cache2 = FileCache(self.directory)
+
+        cache1.set('a', b'123')
+        self.assertEqual(cache2.get('a'), b'123')
+
+        stats = cache2.stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertGreater(stats['bytes'], 3)
+
+        cache2.clear()
+        self.assertIsNone(cache1.get('a'))
+
+    def test_atomic_publish(self):
+        cache = FileCache(self.directory)
+        cache.set('a', b'1')
+        cache.set('a', b'2')
+
+        files = [name for _, _, names in os.walk(self.directory)
+                 for name in names]
+        self.assertEqual(len(files), 1)
+        self.assertEqual(cache.get('a'), b'2')
+
+    def test_evict_least_recently_used(self):
+        cache = FileCache(self.directory, max_size=2, check_interval=1)
+
+        cache.set('a', 1)
+        cache.set('b', 2)
+        past = time.time() - 10
+        for idx, key in enumerate(('a', 'b')):
+            os.utime(cache._path(key), (past + idx, past + idx))
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_max_bytes(self):
+        cache = FileCache(self.directory, max_bytes=200, check_interval=1)
+
+        cache.set('a', b'1' * 150)
+        cache.set('b', b'1' * 150)
+
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_errors(self):
+        cache = FileCache(self.directory)
+
+        cache.set('a', lambda: None)
+        self.assertIsNone(cache.get('a'))
+
+        path = cache._path('b')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'broken')
+        self.assertIsNone(cache.get('b'))
+
+        self.assertEqual(cache.stats()['errors'], 2)
+
+    def test_namespace(self):
+        cache = FileCache(self.directory)
+        tags = cache.namespace('tags')
+
+        self.assertEqual(tags.directory, os.path.join(self.directory, '.tags'))
+        tags.set('a', '1')
+        cache.set('a', '2')
+
+        self.assertEqual(tags.get('a'), '1')
+        self.assertEqual(cache.stats()['size'], 1)
+
+        cache.clear()
+        self.assertEqual(tags.get('a'), '1')
+
+    def test_directory_permissions(self):
+        from pyramid.exceptions import ConfigurationError
+
+        directory = os.path.join(self.directory, 'cache')
+        FileCache(directory)
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+
+        os.chmod(directory, 0o777)
+        self.assertRaises(ConfigurationError, FileCache, directory)
+
+        with mock.patch('djed.layout.cache.os.getuid', return_value=-1):
+            os.chmod(directory, 0o700)
+            self.assertRaises(ConfigurationError, FileCache, directory)
+
+    def test_file_cache_factory(self):
+        from pyramid.exceptions import ConfigurationError
+        from djed.layout.cache import file_cache_factory
+
+        self.assertRaises(ConfigurationError, file_cache_factory, {})
+
+        cache = file_cache_factory({
+            'djed.layout.fragment_cache_directory': self.directory,
+            'djed.layout.fragment_cache_size': '10',
+            'djed.layout.fragment_cache_max_bytes': '1024'},
+            'djed.layout.fragment_cache')
+        self.assertEqual(cache.directory, self.directory)
+        self.assertEqual(cache.max_size, 10)
+        self.assertEqual(cache.max_bytes, 1024)
+
+
+class TestTieredCache(TestCase):
+
+    def test_tiered(self):
+        shared = LRUCache()
+        cache = TieredCache(LRUCache(), shared)
+        self.assertTrue(verifyObject(ILayoutCache, cache))
+
+        shared.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.local.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+        cache.set('b', 2)
+        self.assertEqual(shared.get('b'), 2)
+
+        cache.delete('b')
+        self.assertIsNone(shared.get('b'))
+
+        stats = cache.stats()
+        self.assertEqual(stats['local']['size'], 1)
+        self.assertEqual(stats['shared']['size'], 1)
+
+        cache.clear()
+        self.assertIsNone(shared.get('a'))
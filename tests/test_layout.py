@@ -8,6 +8,7 @@ from djed.testing import BaseTestCase
 
 from djed.layout import query_layout
 from djed.layout import LayoutRenderer
+from djed.layout import CONTENT_MARKER
 
 class View(object):
 
@@ -26,6 +27,45 @@ class TestLayout(BaseTestCase):
     def test_default_settings(self):
 
         self.assertFalse(self.registry.settings['djed.layout.debug'])
+        self.assertIsNone(self.registry.settings['djed.layout.debug_header'])
+        self.assertIsNone(self.registry.settings['djed.layout.debug_cookie'])
+        self.assertEqual(self.registry.settings['djed.layout.debug_sample'], 0)
+        self.assertFalse(self.registry.settings['djed.layout.compile'])
+        self.assertIsNone(self.registry.settings['djed.layout.depth_header'])
+        self.assertFalse(self.registry.settings['djed.layout.etag'])
+        self.assertFalse(self.registry.settings['djed.layout.output_cache'])
+        self.assertIsNone(
+            self.registry.settings['djed.layout.output_cache_backend'])
+        self.assertIsNone(
+            self.registry.settings['djed.layout.output_cache_vary'])
+        self.assertIsNone(
+            self.registry.settings['djed.layout.fragment_cache_backend'])
+        self.assertFalse(self.registry.settings['djed.layout.bytes'])
+        self.assertFalse(self.registry.settings['djed.layout.stream'])
+        self.assertEqual(
+            self.registry.settings['djed.layout.concurrent_views'], 0)
+        self.assertFalse(self.registry.settings['djed.layout.timing'])
+        self.assertFalse(self.registry.settings['djed.layout.timing_header'])
+        self.assertIsNone(
+            self.registry.settings['djed.layout.timing_callback'])
+        self.assertEqual(
+            self.registry.settings['djed.layout.content_types'],
+            {'text/html', 'application/xhtml+xml'})
+        self.assertEqual(
+            self.registry.settings['djed.layout.skip_status'],
+            {204, 206, 301, 302, 303, 304, 307, 308})
+        self.assertEqual(
+            self.registry.settings['djed.layout.max_content_length'], 0)
+        self.assertTrue(self.registry.settings['djed.layout.skip_head'])
+        self.assertEqual(
+            self.registry.settings['djed.layout.prerender_paths'], ())
+        self.assertFalse(self.registry.settings['djed.layout.warmup'])
+        self.assertFalse(self.registry.settings['djed.layout.minify'])
+        self.assertTrue(self.registry.settings['djed.layout.introspection'])
+        self.assertEqual(
+            self.registry.settings['djed.layout.template_cache_size'], 0)
+        self.assertEqual(
+            self.registry.settings['djed.layout.warmup_workers'], 0)
 
     def test_layout_register_simple(self):
 
@@ -173,6 +213,63 @@ class TestLayout(BaseTestCase):
         layout, context = query_layout(Root2(), object(), self.request, 'test')
         self.assertIsNone(layout)
 
+    def test_layout_index(self):
+        from djed.layout import ILayout
+        from djed.layout import layout_index
+
+        class IRoot(interface.Interface):
+            pass
+
+        class IPage(interface.Interface):
+            pass
+
+        @interface.implementer(IRoot)
+        class Root1(object):
+            pass
+
+        @interface.implementer(IPage)
+        class Page(Context):
+            pass
+
+        self.config.add_route('test-route', '/test/', use_global_views=False)
+        self.config.add_layout('test')
+        self.config.add_layout('test', context=IPage)
+        self.config.add_layout('test', context=Page, root=IRoot)
+        self.config.add_layout('test', context=Context, root=Root1)
+        self.config.add_layout(
+            'test', context=Context, route_name='test-route',
+            use_global_views=False)
+        self.config.add_layout('other', context=Context2)
+
+        route_iface = self.registry.getUtility(
+            IRouteRequest, name='test-route')
+        index = layout_index(self.registry)
+        adapters = self.registry.adapters
+
+        for root in (None, Root(), Root1()):
+            for iface in (IRequest, route_iface):
+                for context in (None, Context(), Context2(), Page()):
+                    for name in ('test', 'other', 'unknown'):
+                        required = (interface.providedBy(root), iface,
+                                    interface.providedBy(context))
+                        self.assertIs(
+                            index.lookup(name, *required),
+                            adapters.lookup(required, ILayout, name=name))
+
+    def test_layout_index_invalidation(self):
+        from djed.layout import layout_index
+
+        self.config.add_layout('test', context=Context)
+        index = layout_index(self.registry)
+        self.assertIs(index, layout_index(self.registry))
+
+        self.config.add_layout('test', context=Context2)
+        self.assertIsNot(index, layout_index(self.registry))
+
+        layout, context = query_layout(
+            None, Context2(), self.request, 'test')
+        self.assertIsNotNone(layout)
+
     def test_layout_chain_multi_level(self):
         class Layout1(View):
             """ """
@@ -245,6 +342,72 @@ class TestLayout(BaseTestCase):
         self.assertIn('<!-- layout:', str(res))
         self.assertIn('<h1>text</h1>', str(res))
 
+    def test_layout_no_introspection(self):
+        self.registry.settings['djed.layout.introspection'] = False
+        self.registry.settings['djed.layout.debug'] = True
+
+        self.config.add_layout('test', view=View, parent='.',
+                               renderer='tests:test-layout.pt')
+        self.config.add_layout('', renderer='tests:test-layout.pt')
+
+        layout, context = query_layout(None, Context(), self.request, 'test')
+        self.assertIsNone(layout.intr)
+        self.assertIsNone(
+            self.registry.introspector.get_category('djed:layout'))
+
+        rendr = LayoutRenderer('test')
+        data = rendr.debug_data(layout, Context(), self.request)
+        self.assertEqual(data['name'], 'test')
+        self.assertEqual(data['parent-layout'], '')
+        self.assertEqual(data['layout-factory'], 'tests.test_layout.View')
+        self.assertEqual(data['renderer'], 'tests:test-layout.pt')
+
+        res = rendr('<h1>text</h1>', Context(), self.request)
+        self.assertIn('<!-- layout:', str(res))
+
+    def test_layout_shared_renderer_helper(self):
+        self.config.add_layout('l1', renderer='tests:test-layout.pt')
+        self.config.add_layout('l2', renderer='tests:test-layout.pt')
+
+        l1, context = query_layout(None, Context(), self.request, 'l1')
+        l2, context = query_layout(None, Context(), self.request, 'l2')
+        self.assertIs(l1.renderer, l2.renderer)
+
+    def test_layout_root_discriminator(self):
+        from pyramid.config import Configurator
+
+        class Root1(object):
+            pass
+
+        class Root2(object):
+            pass
+
+        config = Configurator()
+        config.include('djed.layout')
+        config.add_layout('test', root=Root1)
+        config.add_layout('test', root=Root2)
+        config.commit()
+
+    def test_layout_template_cache(self):
+        self.registry.settings['djed.layout.template_cache_size'] = 1
+
+        self.config.add_layout('l1', renderer='tests:test-layout.pt')
+        self.config.add_layout('l2', renderer='tests:test-layout-data.pt')
+
+        l1, context = query_layout(None, Context(), self.request, 'l1')
+        self.request.set_layout_data(count=1)
+
+        res = LayoutRenderer('l1')('text', Context(), self.request)
+        self.assertEqual(res, '<div>text</div>\n')
+        self.assertIn('template', l1.renderer.renderer.__dict__)
+
+        LayoutRenderer('l2')('text', Context(), self.request)
+        self.assertNotIn('template', l1.renderer.renderer.__dict__)
+
+        res = LayoutRenderer('l1')('text', Context(), self.request)
+        self.assertEqual(res, '<div>text</div>\n')
+        self.assertIn('template', l1.renderer.renderer.__dict__)
+
     def test_layout_renderer_layout_debug_html(self):
         self.registry.settings['djed.layout.debug'] = True
 
@@ -291,6 +454,796 @@ class TestLayout(BaseTestCase):
 
         self.assertEqual('<div>test</div>', res.text.strip())
 
+    def test_layout_renderer_chunks(self):
+        self.config.add_layout(
+            'test', parent='.', renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            '', context=Root, renderer='tests:test-layout-html.pt')
+
+        root = Root()
+        rendr = LayoutRenderer('test')
+        chunks = rendr.render_chunks(b'View: test', Context(root), self.request)
+
+        self.assertEqual(
+            chunks, [b'<html>', b'<div>', b'View: test', b'</div>\n', b'</html>\n'])
+        self.assertEqual(
+            b''.join(chunks).decode('utf-8'),
+            rendr('View: test', Context(root), self.request))
+
+    def test_layout_renderer_chunks_not_splittable(self):
+        self.config.add_layout(
+            'test', parent='.', renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            '', context=Root, renderer='tests:test-layout-escaped.pt')
+
+        root = Root()
+        rendr = LayoutRenderer('test')
+        chunks = rendr.render_chunks(b'<b>', Context(root), self.request)
+
+        self.assertEqual(
+            b''.join(chunks), b'<p>&lt;div&gt;&lt;b&gt;&lt;/div&gt;\n</p>\n')
+
+    @mock.patch('djed.layout.query_layout_chain')
+    def test_layout_renderer_chunks_no_layouts(self, m):
+        m.return_value = []
+        rendr = LayoutRenderer('test')
+
+        chunks = rendr.render_chunks(b'body', Context(), self.request)
+        self.assertEqual(chunks, [b'body'])
+
+    def test_layout_renderer_bytes_mode(self):
+        self.registry.settings['djed.layout.bytes'] = True
+
+        self.config.add_layout('test', view=View,
+                               renderer='tests:test-layout.pt')
+        self.config.add_view(
+            name='view.html',
+            renderer='tests:view.pt',
+            layout='test')
+
+        app = self.make_app()
+
+        res = app.get('/view.html')
+        self.assertEqual('<div><h1>Test</h1></div>', res.text.strip())
+        self.assertEqual(res.content_length, len(res.body))
+
+    def test_layout_renderer_stream_mode(self):
+        from pyramid.response import Response
+        from djed.layout import layout_tween_factory
+
+        self.registry.settings['djed.layout.stream'] = True
+        self.config.add_layout(
+            'test', parent='.', renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            '', context=Root, renderer='tests:test-layout-html.pt')
+
+        events = []
+
+        def body():
+            events.append('body')
+            yield b'View: test'
+
+        def handler(request):
+            return Response(app_iter=body(), content_type='text/html')
+
+        self.request.layout = 'test'
+        self.request.context = Context(Root())
+
+        response = layout_tween_factory(handler, self.registry)(self.request)
+        self.assertIsNone(response.content_length)
+
+        app_iter = iter(response.app_iter)
+        self.assertEqual(next(app_iter), b'<html>')
+        self.assertEqual(next(app_iter), b'<div>')
+        self.assertEqual(events, [])
+        self.assertEqual(
+            list(app_iter), [b'View: test', b'</div>\n', b'</html>\n'])
+        self.assertEqual(events, ['body'])
+
+    def test_layout_renderer_stream_mode_app(self):
+        self.registry.settings['djed.layout.stream'] = True
+
+        self.config.add_layout('test', view=View,
+                               renderer='tests:test-layout.pt')
+        self.config.add_view(
+            name='view.html',
+            renderer='tests:view.pt',
+            layout='test')
+
+        app = self.make_app()
+
+        res = app.get('/view.html')
+        self.assertEqual('<div><h1>Test</h1></div>', res.text.strip())
+
+    def test_layout_renderer_cacheable(self):
+        from djed.layout import _fragment_cache
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+
+        rendr = LayoutRenderer('test')
+        res = rendr('View: test', Context(), self.request)
+        self.assertEqual(res, '<div>View: test</div>\n')
+
+        with mock.patch.object(rendr, 'render_layout') as m:
+            res = rendr('View: test2', Context(), self.request)
+            self.assertFalse(m.called)
+
+        self.assertEqual(res, '<div>View: test2</div>\n')
+
+        chunks = rendr.render_chunks(b'View: test3', Context(), self.request)
+        self.assertEqual(chunks, [b'<div>', b'View: test3', b'</div>\n'])
+
+        stats = _fragment_cache(self.registry).stats()
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_layout_renderer_cacheable_shared(self):
+        import shutil
+        import tempfile
+        from pyramid.config import Configurator
+        from djed.layout import layout_cache_stats
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        def make_registry():
+            config = Configurator(settings={
+                'djed.layout.fragment_cache_backend':
+                'djed.layout.cache.file_cache_factory',
+                'djed.layout.fragment_cache_directory': directory})
+            config.include('djed.layout')
+            config.include('pyramid_chameleon')
+            config.add_layout(
+                'test', renderer='tests:test-layout.pt', cacheable=True)
+            config.commit()
+            return config.registry
+
+        # two worker processes
+        registry1 = make_registry()
+        registry2 = make_registry()
+
+        rendr = LayoutRenderer('test')
+        res = rendr('View: test',
+                    Context(), self.make_request(registry=registry1))
+        self.assertEqual(res, '<div>View: test</div>\n')
+
+        request = self.make_request(registry=registry2)
+        with mock.patch.object(rendr, 'render_layout') as m:
+            res = rendr('View: test2', Context(), request)
+            self.assertFalse(m.called)
+        self.assertEqual(res, '<div>View: test2</div>\n')
+
+        stats = layout_cache_stats(registry2)
+        self.assertEqual(stats['fragments']['local']['size'], 1)
+        self.assertEqual(stats['fragments']['shared']['hits'], 1)
+        self.assertEqual(stats['fragments']['shared']['size'], 1)
+        self.assertIn('output', stats)
+
+    def test_layout_renderer_cacheable_vary(self):
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True,
+            cache_vary=lambda context, request: request.locale_name)
+
+        rendr = LayoutRenderer('test')
+        rendr('View: test', Context(), self.request)
+        self.request.locale_name = 'fr'
+
+        with mock.patch.object(rendr, 'render_layout') as m:
+            m.return_value = '<p>%s</p>' % CONTENT_MARKER
+            res = rendr('View: test', Context(), self.request)
+
+        self.assertEqual(res, '<p>View: test</p>')
+
+    def test_layout_renderer_cacheable_not_splittable(self):
+        self.config.add_layout(
+            'test', renderer='tests:test-layout-escaped.pt', cacheable=True)
+
+        rendr = LayoutRenderer('test')
+        res1 = rendr('<b>', Context(), self.request)
+        res2 = rendr('<i>', Context(), self.request)
+
+        self.assertEqual(res1, '<p>&lt;b&gt;</p>\n')
+        self.assertEqual(res2, '<p>&lt;i&gt;</p>\n')
+
+    def test_layout_renderer_cacheable_invalidation(self):
+        from djed.layout import _fragment_cache
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+
+        rendr = LayoutRenderer('test')
+        rendr('View: test', Context(), self.request)
+        self.assertEqual(len(_fragment_cache(self.registry)), 1)
+
+        self.config.add_layout('test2')
+        self.assertEqual(len(_fragment_cache(self.registry)), 0)
+
+    def test_layout_renderer_concurrent_views(self):
+        import threading
+
+        self.registry.settings['djed.layout.concurrent_views'] = 3
+        barrier = threading.Barrier(3, timeout=5)
+
+        def view(name):
+            def layout_view(context, request):
+                barrier.wait()
+                return {'name': name, name: True}
+            return layout_view
+
+        self.config.add_layout(
+            'l1', parent='l2', view=view('l1'),
+            renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l2', parent='l3', view=view('l2'),
+            renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l3', view=view('l3'), renderer='tests:test-layout-html.pt')
+
+        rendr = LayoutRenderer('l1')
+        res = rendr('View: test', Context(), self.request)
+
+        self.assertEqual(
+            res, '<html><div><div>View: test</div>\n</div>\n</html>\n')
+        self.assertEqual(
+            self.request.layout_data,
+            {'name': 'l3', 'l1': True, 'l2': True, 'l3': True})
+
+    def test_layout_renderer_concurrent_views_threadlocals(self):
+        from pyramid.threadlocal import get_current_request
+        from pyramid.threadlocal import get_current_registry
+
+        self.registry.settings['djed.layout.concurrent_views'] = 2
+
+        def view(context, request):
+            return {'request': get_current_request(),
+                    'registry': get_current_registry()}
+
+        self.config.add_layout(
+            'test', view=view, renderer='tests:test-layout.pt')
+
+        rendr = LayoutRenderer('test')
+        rendr('View: test', Context(), self.request)
+
+        self.assertIs(self.request.layout_data['request'], self.request)
+        self.assertIs(self.request.layout_data['registry'], self.registry)
+
+    def test_layout_renderer_coroutine_views(self):
+        import asyncio
+
+        started = []
+
+        async def l1(context, request):
+            started.append('l1')
+            await asyncio.sleep(0)
+            return {'started': list(started)}
+
+        async def l2(context, request):
+            started.append('l2')
+            return {'l2': True}
+
+        self.config.add_layout(
+            'l1', parent='l2', view=l1, renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l2', view=l2, renderer='tests:test-layout.pt')
+
+        rendr = LayoutRenderer('l1')
+        res = rendr('View: test', Context(), self.request)
+        self.assertEqual(res, '<div><div>View: test</div>\n</div>\n')
+        self.assertEqual(self.request.layout_data['started'], ['l1'])
+
+        self.registry.settings['djed.layout.concurrent_views'] = 2
+        del self.registry._djed_layout_executor
+        del started[:]
+
+        self.request = self.make_request()
+        rendr('View: test', Context(), self.request)
+        self.assertEqual(self.request.layout_data['started'], ['l1', 'l2'])
+        self.assertTrue(self.request.layout_data['l2'])
+
+    def test_layout_renderer_timings_disabled(self):
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+
+        LayoutRenderer('test')('View: test', Context(), self.request)
+        self.assertFalse(hasattr(self.request, 'layout_timings'))
+
+    def test_layout_renderer_timings(self):
+        callback = mock.Mock()
+        self.registry.settings['djed.layout.timing'] = True
+        self.registry.settings['djed.layout.timing_callback'] = callback
+
+        self.config.add_layout(
+            'test', parent='.', view=View, renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            '', context=Root, renderer='tests:test-layout-html.pt')
+
+        root = Root()
+        LayoutRenderer('test')('View: test', Context(root), self.request)
+        LayoutRenderer('test').render_chunks(
+            b'View: test', Context(root), self.request)
+
+        timings = self.request.layout_timings
+        self.assertEqual(len(timings), 2)
+        self.assertEqual(callback.call_args_list, [
+            mock.call(self.request, timings[0]),
+            mock.call(self.request, timings[1])])
+
+        for item in timings:
+            self.assertEqual(item.layout, 'test')
+            self.assertEqual([l.name for l in item.levels], ['test', ''])
+            self.assertEqual([l.size for l in item.levels], [12, 14])
+            self.assertGreater(item.total, 0)
+
+    def test_layout_renderer_timings_header(self):
+        self.registry.settings['djed.layout.timing'] = True
+        self.registry.settings['djed.layout.timing_header'] = True
+
+        self.config.add_layout('test', view=View,
+                               renderer='tests:test-layout.pt')
+        self.config.add_view(
+            name='view.html',
+            renderer='tests:view.pt',
+            layout='test')
+
+        app = self.make_app()
+        res = app.get('/view.html')
+
+        header = res.headers['Server-Timing']
+        self.assertIn('layout-resolve-0;desc="test";dur=', header)
+        self.assertIn('layout-view-0-0;desc="test";dur=', header)
+        self.assertIn('layout-render-0-0;desc="test";dur=', header)
+
+    def test_server_timing(self):
+        from djed.layout import LayoutTimings, server_timing
+
+        timings = LayoutTimings('a"b')
+        timings.resolve = 0.001
+        timings.views = 0.002
+        timings.add('', 0, 0.0005, 10)
+
+        self.assertEqual(
+            server_timing([timings]),
+            'layout-resolve-0;desc="a\\"b";dur=1.000, '
+            'layout-views-0;dur=2.000, '
+            'layout-view-0-0;desc="";dur=0.000, '
+            'layout-render-0-0;desc="";dur=0.500')
+
+    def _tween_response(self, **kw):
+        from pyramid.response import Response
+        from djed.layout import layout_tween_factory
+
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+        self.request.layout = 'test'
+        self.request.context = Context()
+
+        def handler(request):
+            return Response(**kw)
+
+        return layout_tween_factory(handler, self.registry)(self.request)
+
+    def test_layout_tween_filter_content_type(self):
+        res = self._tween_response(
+            body=b'{}', content_type='application/json')
+        self.assertEqual(res.body, b'{}')
+
+        res = self._tween_response(
+            body=b'text', content_type='application/xhtml+xml')
+        self.assertEqual(res.body, b'<div>text</div>\n')
+
+    def test_layout_tween_filter_any_content_type(self):
+        self.registry.settings['djed.layout.content_types'] = frozenset()
+
+        res = self._tween_response(body=b'text', content_type='text/plain')
+        self.assertEqual(res.body, b'<div>text</div>\n')
+
+    def test_layout_tween_filter_status(self):
+        res = self._tween_response(status=304)
+        self.assertEqual(res.body, b'')
+
+        res = self._tween_response(body=b'text', status=404)
+        self.assertEqual(res.body, b'<div>text</div>\n')
+
+    def test_layout_tween_filter_head(self):
+        self.request.method = 'HEAD'
+        res = self._tween_response(body=b'text')
+        self.assertEqual(res.body, b'text')
+
+        self.registry.settings['djed.layout.skip_head'] = False
+        res = self._tween_response(body=b'text')
+        self.assertEqual(res.body, b'<div>text</div>\n')
+
+    def test_layout_tween_filter_content_length(self):
+        self.registry.settings['djed.layout.max_content_length'] = 4
+
+        res = self._tween_response(body=b'large')
+        self.assertEqual(res.body, b'large')
+
+        res = self._tween_response(body=b'text')
+        self.assertEqual(res.body, b'<div>text</div>\n')
+
+    def test_layout_tween_filter_app_iter(self):
+        def body():
+            raise AssertionError('body must not be consumed')
+            yield b''
+
+        res = self._tween_response(app_iter=body())
+        self.assertIsNotNone(res.app_iter)
+
+    def test_layout_predicate_opt_out(self):
+        from pyramid.response import Response
+
+        def view(request):
+            return Response('test')
+
+        self.config.add_layout(
+            'test', view=View, renderer='tests:test-layout.pt')
+        self.config.add_view(name='view.html', view=view, layout='test')
+        self.config.add_view(name='file.html', view=view, layout=False)
+
+        app = self.make_app()
+        self.assertEqual(app.get('/view.html').text, '<div>test</div>\n')
+        self.assertEqual(app.get('/file.html').text, 'test')
+
+    def test_layout_debug_per_request(self):
+        from djed.layout import layout_debug
+
+        self.registry.settings['djed.layout.debug_header'] = 'X-Layout-Debug'
+        self.registry.settings['djed.layout.debug_cookie'] = 'layout-debug'
+
+        self.assertFalse(layout_debug(self.make_request()))
+
+        request = self.make_request(headers={'X-Layout-Debug': '1'})
+        self.assertTrue(layout_debug(request))
+
+        request = self.make_request(cookies={'layout-debug': '1'})
+        self.assertTrue(layout_debug(request))
+
+    @mock.patch('djed.layout.random')
+    def test_layout_debug_sample(self, m_random):
+        from djed.layout import layout_debug
+
+        self.registry.settings['djed.layout.debug_sample'] = 0.1
+
+        m_random.random.return_value = 0.5
+        request = self.make_request()
+        self.assertFalse(layout_debug(request))
+
+        m_random.random.return_value = 0.05
+        self.assertFalse(layout_debug(request))
+        self.assertTrue(layout_debug(self.make_request()))
+
+    def test_layout_color(self):
+        from djed.layout import layout_color
+
+        self.assertEqual(layout_color('test'), layout_color('test'))
+        self.assertNotEqual(layout_color('test'), layout_color('test2'))
+        self.assertLessEqual(layout_color('test'), 0xFFFFFF)
+
+    def test_layout_renderer_layout_debug_fragment(self):
+        from djed.layout import layout_color
+
+        self.request.headers['X-Layout-Debug'] = '1'
+        self.registry.settings['djed.layout.debug_header'] = 'X-Layout-Debug'
+
+        self.config.add_layout(
+            'test', parent='.', renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            '', context=Root, renderer='tests:test-layout-html.pt')
+
+        root = Root()
+        rendr = LayoutRenderer('test')
+        res = rendr('<html>view</html>', Context(root), self.request)
+
+        self.assertEqual(res.count('<!-- layout:'), 2)
+        self.assertIn('<html>view</html>', res)
+        self.assertIn('<html style="border: 2px solid #%06x" title="">' % (
+            layout_color(''),), res)
+        self.assertIn('<div style="border: 2px solid #%06x" title="test">' % (
+            layout_color('test'),), res)
+
+        chunks = rendr.render_chunks(
+            b'<html>view</html>', Context(root), self.request)
+        self.assertEqual(b''.join(chunks).decode('utf-8'), res)
+
+    def test_layout_etag(self):
+        self.registry.settings['djed.layout.etag'] = True
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True,
+            cache_vary=lambda context, request: request.params.get('lang'))
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+
+        res = app.get('/view.html')
+        etag = res.headers['ETag']
+        self.assertEqual('<div><h1>Test</h1></div>', res.text.strip())
+
+        with mock.patch.object(LayoutRenderer, 'render_layout') as m:
+            res = app.get('/view.html', headers={'If-None-Match': etag},
+                          status=304)
+            self.assertFalse(m.called)
+
+        self.assertEqual(res.body, b'')
+        self.assertEqual(res.headers['ETag'], etag)
+
+        res = app.get('/view.html?lang=fr', headers={'If-None-Match': etag})
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual('<div><h1>Test</h1></div>', res.text.strip())
+
+    def test_layout_etag_invalidate(self):
+        from djed.layout.tags import invalidate_layouts
+
+        self.registry.settings['djed.layout.etag'] = True
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+        etag = app.get('/view.html').headers['ETag']
+        app.get('/view.html', headers={'If-None-Match': etag}, status=304)
+
+        invalidate_layouts(self.registry, layout='test')
+
+        res = app.get('/view.html', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_int, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual('<div><h1>Test</h1></div>', res.text.strip())
+
+    def test_layout_etag_not_cacheable(self):
+        self.registry.settings['djed.layout.etag'] = True
+
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+
+        res = app.get('/view.html')
+        self.assertNotIn('ETag', res.headers)
+
+    def test_layout_etag_debug(self):
+        self.registry.settings['djed.layout.etag'] = True
+        self.registry.settings['djed.layout.debug_header'] = 'X-Layout-Debug'
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+        etag = app.get('/view.html').headers['ETag']
+
+        res = app.get('/view.html', headers={
+            'If-None-Match': etag, 'X-Layout-Debug': '1'})
+        self.assertEqual(res.status_int, 200)
+        self.assertNotIn('ETag', res.headers)
+        self.assertIn('<!-- layout:', res.text)
+
+    def test_layout_etag_view(self):
+        self.registry.settings['djed.layout.etag'] = True
+
+        def view(request):
+            request.response.etag = 'view'
+            return {}
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+        self.config.add_view(
+            view, name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+        res = app.get('/view.html', headers={'If-None-Match': '"view"'})
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers['ETag'], '"view"')
+        self.assertEqual('<div><h1>Test</h1></div>', res.text.strip())
+
+    def test_layout_etag_content(self):
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+
+        rendr = LayoutRenderer('test')
+        etag1 = rendr.etag(b'content1', Context(), self.request)
+        etag2 = rendr.etag(b'content2', Context(), self.request)
+
+        self.assertNotEqual(etag1, etag2)
+        self.assertEqual(etag1, rendr.etag(b'content1', Context(), self.request))
+        self.assertIsNone(
+            LayoutRenderer('unknown').etag(b'content', Context(), self.request))
+
+    def test_layout_version(self):
+        from djed.layout import layout_version
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+        layout = query_layout(Root(), Context(), self.request, 'test')[0]
+
+        version = layout_version(layout, self.registry)
+        self.assertTrue(version.startswith('tests:test-layout.pt:'))
+
+        with mock.patch('djed.layout.os.stat') as m:
+            m.return_value.st_mtime = 1
+            m.return_value.st_size = 2
+            self.assertEqual(layout_version(layout, self.registry), version)
+
+            self.registry.settings['reload_templates'] = True
+            self.assertEqual(layout_version(layout, self.registry),
+                             'tests:test-layout.pt:1:2')
+
+    def test_layout_output_cache(self):
+        from djed.layout import get_output_cache
+
+        self.registry.settings['djed.layout.output_cache'] = True
+        self.registry.settings['djed.layout.output_cache_vary'] = \
+            lambda request: request.params.get('lang')
+
+        self.config.add_layout('test', view=View,
+                               renderer='tests:test-layout.pt')
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+
+        res1 = app.get('/view.html')
+        with mock.patch.object(LayoutRenderer, 'render_layout') as m:
+            res2 = app.get('/view.html')
+            self.assertFalse(m.called)
+
+        self.assertEqual('<div><h1>Test</h1></div>', res1.text.strip())
+        self.assertEqual(res1.body, res2.body)
+
+        app.get('/view.html?lang=fr')
+
+        stats = get_output_cache(self.registry).stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['size'], 2)
+
+    def test_layout_output_cache_debug(self):
+        from djed.layout import get_output_cache
+
+        self.registry.settings['djed.layout.output_cache'] = True
+        self.registry.settings['djed.layout.debug_header'] = 'X-Layout-Debug'
+
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+
+        res = app.get('/view.html', headers={'X-Layout-Debug': '1'})
+        self.assertIn('<!-- layout:', res.text)
+        self.assertEqual(len(get_output_cache(self.registry)), 0)
+
+        res = app.get('/view.html')
+        self.assertEqual('<div><h1>Test</h1></div>', res.text.strip())
+
+        res = app.get('/view.html', headers={'X-Layout-Debug': '1'})
+        self.assertIn('<!-- layout:', res.text)
+
+    def test_layout_output_cache_backend(self):
+        from djed.layout.cache import LRUCache
+
+        backend = LRUCache()
+        self.registry.settings['djed.layout.output_cache'] = True
+        self.registry.settings['djed.layout.output_cache_backend'] = \
+            lambda settings: backend
+
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+        app.get('/view.html')
+        app.post('/view.html')
+
+        self.assertEqual(len(backend), 1)
+        self.assertEqual(backend.stats()['misses'], 1)
+
+    def test_layout_cache_key(self):
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+        self.config.add_layout('test2', renderer='tests:test-layout.pt')
+
+        rendr = LayoutRenderer('test')
+        key = rendr.cache_key(b'content', Context(), self.request)
+
+        self.assertEqual(
+            key, rendr.cache_key(b'content', Context(), self.request))
+        self.assertNotEqual(
+            key, rendr.cache_key(b'content2', Context(), self.request))
+        self.assertNotEqual(
+            key, rendr.cache_key(b'content', Context(), self.request, 'fr'))
+        self.assertNotEqual(
+            key, LayoutRenderer('test2').cache_key(
+                b'content', Context(), self.request))
+        self.assertIsNone(LayoutRenderer('unknown').cache_key(
+            b'content', Context(), self.request))
+
+    def _add_chain(self):
+        self.config.add_layout(
+            'l1', parent='l2', view=View, renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l2', parent='l3', view=View, renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l3', view=View, renderer='tests:test-layout-html.pt')
+
+    def test_layout_renderer_partial_depth(self):
+        self._add_chain()
+        rendr = LayoutRenderer('l1')
+
+        self.request.layout_depth = 1
+        self.assertEqual(
+            rendr('View', Context(), self.request), '<div>View</div>\n')
+
+        self.request.layout_depth = 'l2'
+        self.assertEqual(
+            rendr('View', Context(), self.request),
+            '<div><div>View</div>\n</div>\n')
+
+        self.request.layout_depth = 0
+        with mock.patch.object(rendr, 'render_layout') as m:
+            self.assertEqual(rendr('View', Context(), self.request), 'View')
+            self.assertFalse(m.called)
+
+        self.request.layout_depth = 'unknown'
+        self.assertEqual(len(rendr.chain(Context(), self.request)), 3)
+
+    def test_layout_renderer_partial_depth_skip_views(self):
+        calls = []
+
+        def view(context, request):
+            calls.append(context)
+
+        self.config.add_layout(
+            'l1', parent='l2', renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            'l2', view=view, renderer='tests:test-layout.pt')
+
+        self.request.layout_depth = 1
+        LayoutRenderer('l1')('View', Context(), self.request)
+        self.assertEqual(calls, [])
+
+    def test_layout_depth_header(self):
+        self.registry.settings['djed.layout.depth_header'] = 'X-Layout-Depth'
+        self._add_chain()
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='l1')
+
+        app = self.make_app()
+
+        res = app.get('/view.html')
+        self.assertTrue(res.text.startswith('<html>'))
+        self.assertEqual(res.headers['Vary'], 'X-Layout-Depth')
+
+        res = app.get('/view.html', headers={'X-Layout-Depth': '1'})
+        self.assertEqual(res.text, '<div><h1>Test</h1></div>\n')
+
+        res = app.get('/view.html', headers={'X-Layout-Depth': 'l2'})
+        self.assertEqual(
+            res.text, '<div><div><h1>Test</h1></div>\n</div>\n')
+
+    def test_layout_depth_predicate(self):
+        self._add_chain()
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt',
+            layout='l1', layout_depth=2)
+
+        app = self.make_app()
+
+        res = app.get('/view.html')
+        self.assertEqual(
+            res.text, '<div><div><h1>Test</h1></div>\n</div>\n')
+
+    def test_parse_layout_depth(self):
+        from djed.layout import parse_layout_depth
+
+        self.assertEqual(parse_layout_depth(' 2 '), 2)
+        self.assertEqual(parse_layout_depth('page'), 'page')
+
     def test_layout_renderer_layout_info(self):
 
         self.config.add_layout('test')
@@ -325,6 +1278,210 @@ class TestLayout(BaseTestCase):
 
         self.assertEqual([], chain)
 
+    def test_query_layout_chain_cached(self):
+        from djed.layout import query_layout_chain
+
+        self.config.add_layout(
+            'test', parent='.', renderer='tests:test-layout.pt')
+        self.config.add_layout(
+            '', context=Root, renderer='tests:test-layout-html.pt')
+
+        root = Root()
+        chain1 = query_layout_chain(root, Context(root), self.request, 'test')
+
+        context = Context(root)
+        with mock.patch('djed.layout.query_layout') as m:
+            chain2 = query_layout_chain(root, context, self.request, 'test')
+            self.assertFalse(m.called)
+
+        self.assertEqual(len(chain2), 2)
+        self.assertIs(chain1[0][0], chain2[0][0])
+        self.assertIs(chain2[0][1], context)
+        self.assertIs(chain2[1][1], root)
+
+    def test_query_layout_chain_cache_invalidation(self):
+        from djed.layout import query_layout_chain
+
+        self.config.add_layout('test', parent='.')
+
+        root = Root()
+        chain = query_layout_chain(root, Context(root), self.request, 'test')
+        self.assertEqual(len(chain), 1)
+
+        self.config.add_layout('', context=Root)
+
+        chain = query_layout_chain(root, Context(root), self.request, 'test')
+        self.assertEqual(len(chain), 2)
+
+    def test_compile_layouts(self):
+        from djed.layout import compile_layouts
+
+        self.config.add_layout('test', parent='.')
+        self.config.add_layout('', context=Root)
+        self.config.add_layout('', context=Context, parent='.')
+
+        plan = compile_layouts(self.registry)
+        self.assertEqual(plan.names, frozenset(('test', '')))
+        self.assertEqual(plan.parents['test'], {''})
+
+        with mock.patch.object(self.registry.adapters, 'lookup') as m:
+            layout, context = query_layout(
+                Root(), Context(), self.request, 'unknown')
+            self.assertIsNone(layout)
+            self.assertFalse(m.called)
+
+    def test_compile_layouts_missing_parent(self):
+        from pyramid.exceptions import ConfigurationError
+        from djed.layout import compile_layouts
+
+        self.config.add_layout('test', parent='page')
+
+        self.assertRaises(
+            ConfigurationError, compile_layouts, self.registry)
+
+    def test_compile_layouts_cycle(self):
+        from pyramid.exceptions import ConfigurationError
+        from djed.layout import compile_layouts
+
+        self.config.add_layout('l1', parent='l2')
+        self.config.add_layout('l2', parent='l3')
+        self.config.add_layout('l3', parent='l1')
+
+        with self.assertRaises(ConfigurationError) as cm:
+            compile_layouts(self.registry)
+        self.assertIn("'l1' -> 'l2' -> 'l3' -> 'l1'", str(cm.exception))
+
+    def test_compile_layouts_cycle_per_registration(self):
+        from djed.layout import compile_layouts
+
+        from djed.layout import query_layout_chain
+
+        class IFolder(interface.Interface):
+            pass
+
+        @interface.implementer(IFolder)
+        class Folder(Context):
+            pass
+
+        self.config.add_layout('', context=Root)
+        self.config.add_layout('page', context=Root, parent='.')
+        self.config.add_layout('', context=IFolder, parent='page')
+
+        plan = compile_layouts(self.registry)
+        self.assertEqual(plan.names, frozenset(('', 'page')))
+
+        root = Root()
+        chain = query_layout_chain(root, Folder(root), self.request)
+        self.assertEqual(
+            [(l.name, c.__class__) for l, c in chain],
+            [('', Folder), ('page', Root), ('', Root)])
+
+    def test_compile_layouts_cycle_other_root(self):
+        from djed.layout import compile_layouts
+
+        class IRoot1(interface.Interface):
+            pass
+
+        class IRoot2(interface.Interface):
+            pass
+
+        self.config.add_layout('l1', root=IRoot1, parent='l2')
+        self.config.add_layout('l2', root=IRoot2, parent='l1')
+
+        compile_layouts(self.registry)
+
+    def test_compile_layouts_plan_invalidation(self):
+        from djed.layout import compile_layouts
+
+        compile_layouts(self.registry)
+        self.config.add_layout('test')
+
+        layout, context = query_layout(Root(), Context(), self.request, 'test')
+        self.assertIsNotNone(layout)
+
+    def test_compile_layouts_on_commit(self):
+        from pyramid.config import Configurator
+        from pyramid.exceptions import ConfigurationExecutionError
+
+        config = Configurator(settings={'djed.layout.compile': 'true'})
+        config.include('djed.layout')
+        config.add_layout('test', parent='page')
+
+        self.assertRaises(ConfigurationExecutionError, config.commit)
+
+        config = Configurator(settings={'djed.layout.compile': 'true'})
+        config.include('djed.layout')
+        config.add_layout('test', parent='.')
+        config.add_layout('')
+        config.commit()
+
+        self.assertEqual(
+            config.registry._djed_layout_plan.names, frozenset(('test', '')))
+
+    def test_warmup_layouts(self):
+        from djed.layout import warmup_layouts
+
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+        self.config.add_layout('test2', renderer='tests:test-layout.pt')
+        self.config.add_layout('test3', renderer=View())
+
+        self.assertEqual(warmup_layouts(self.registry), 1)
+
+        layout, context = query_layout(Root(), Context(), self.request, 'test')
+        self.assertTrue(layout.renderer.renderer.template._cooked)
+
+    def test_warmup_layouts_broken_template(self):
+        import os
+        import tempfile
+        from pyramid.config import Configurator
+        from pyramid.exceptions import ConfigurationExecutionError
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'broken.pt')
+            with open(path, 'w') as f:
+                f.write('<div tal:content="">${</div>')
+
+            config = Configurator(settings={'djed.layout.warmup': 'true'})
+            config.include('djed.layout')
+            config.include('pyramid_chameleon')
+            config.add_layout('test', renderer=path)
+
+            with self.assertRaises(ConfigurationExecutionError) as cm:
+                config.commit()
+
+        self.assertIn("Can't load template", str(cm.exception))
+
+    def test_layout_renderer_chain_memo(self):
+        from djed.layout import query_layout_chain
+
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+
+        context = Context()
+        rendr = LayoutRenderer('test')
+
+        with mock.patch('djed.layout.query_layout_chain',
+                        wraps=query_layout_chain) as m:
+            rendr('View: 1', context, self.request)
+            res = LayoutRenderer('test')('View: 2', context, self.request)
+            self.assertEqual(m.call_count, 1)
+
+            rendr('View: 3', Context(), self.request)
+            self.assertEqual(m.call_count, 2)
+
+            rendr('View: 4', context, self.make_request())
+            self.assertEqual(m.call_count, 3)
+
+        self.assertEqual(res, '<div>View: 2</div>\n')
+
+    def test_get_layout_renderer(self):
+        from djed.layout import get_layout_renderer
+
+        rendr = get_layout_renderer(self.registry, 'test')
+        self.assertIsInstance(rendr, LayoutRenderer)
+        self.assertEqual(rendr.layout, 'test')
+        self.assertIs(rendr, get_layout_renderer(self.registry, 'test'))
+        self.assertIsNot(rendr, get_layout_renderer(self.registry, ''))
+
     def test_set_layout_data(self):
         request = self.request
 
@@ -333,6 +1490,113 @@ class TestLayout(BaseTestCase):
         self.assertIn('test', request.layout_data)
         self.assertEqual(request.layout_data['test'], 123)
 
+    def test_layout_data_provider(self):
+        calls = []
+
+        def count(context, request):
+            calls.append(context)
+            return 5
+
+        self.config.add_layout_data_provider('count', count)
+        self.config.add_layout('test', renderer='tests:test-layout.pt')
+        self.config.add_layout('data', renderer='tests:test-layout-data.pt')
+
+        request = self.request
+        request.context = Context()
+
+        res = LayoutRenderer('test')('View: test', request.context, request)
+        self.assertEqual(res, '<div>View: test</div>\n')
+        self.assertEqual(calls, [])
+
+        res = LayoutRenderer('data')('View: test', request.context, request)
+        self.assertEqual(res, '<div>5 5View: test</div>\n')
+        self.assertEqual(calls, [request.context])
+
+    def test_layout_data_provider_per_layout(self):
+        from djed.layout import lazy_data
+
+        calls = []
+
+        def count(context, request):
+            calls.append(context)
+            return 7
+
+        self.config.add_layout(
+            'data', parent='test', renderer='tests:test-layout-data.pt')
+        self.config.add_layout(
+            'test', context=Root, renderer='tests:test-layout.pt')
+        self.config.add_layout_data_provider('count', count, layout='data')
+
+        root = Root()
+        context = Context(root)
+
+        self.assertNotIn('count', self.request.layout_data)
+
+        res = LayoutRenderer('data')('View: test', context, self.request)
+        self.assertEqual(res, '<div><div>7 7View: test</div>\n</div>\n')
+        self.assertEqual(calls, [context])
+        self.assertIsInstance(self.request.layout_data['count'], lazy_data)
+
+    def test_layout_data_provider_view_overrides(self):
+        self.config.add_layout_data_provider(
+            'count', lambda context, request: 1 / 0)
+        self.config.add_layout(
+            'data', renderer='tests:test-layout-data.pt',
+            view=lambda context, request: {'count': 3})
+
+        res = LayoutRenderer('data')('View: test', Context(), self.request)
+        self.assertEqual(res, '<div>3 3View: test</div>\n')
+
+    def test_layout_data_provider_per_layout_view_data(self):
+        self.config.add_layout('data', renderer='tests:test-layout-data.pt')
+        self.config.add_layout_data_provider(
+            'count', lambda context, request: 1 / 0, layout='data')
+
+        self.request.set_layout_data(count='from-view')
+
+        res = LayoutRenderer('data')('View: test', Context(), self.request)
+        self.assertEqual(res, '<div>from-view from-viewView: test</div>\n')
+
+    def test_layout_data_provider_per_layout_memoized(self):
+        calls = []
+
+        def count(context, request):
+            calls.append(context)
+            return 7
+
+        self.config.add_layout('data', renderer='tests:test-layout-data.pt')
+        self.config.add_layout_data_provider('count', count, layout='data')
+
+        rendr = LayoutRenderer('data')
+        context = Context()
+        rendr('View: 1', context, self.request)
+        res = rendr('View: 2', context, self.request)
+
+        self.assertEqual(res, '<div>7 7View: 2</div>\n')
+        self.assertEqual(calls, [context])
+
+    def test_lazy_data(self):
+        from djed.layout import lazy_data
+
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return [1, 2]
+
+        value = lazy_data(factory)
+        self.assertIn('lazy_data', repr(value))
+        self.assertEqual(calls, [])
+
+        self.assertEqual(len(value), 2)
+        self.assertEqual(list(value), [1, 2])
+        self.assertIn(2, value)
+        self.assertEqual(value[0], 1)
+        self.assertEqual(value, [1, 2])
+        self.assertEqual(value.index(2), 1)
+        self.assertEqual(repr(value), '[1, 2]')
+        self.assertEqual(calls, [1])
+
     @mock.patch('djed.layout.venusian')
     def test_layout_decorator(self, m_venusian):
         from djed.layout import layout_config
@@ -355,6 +1619,27 @@ class TestLayout(BaseTestCase):
             (interface.providedBy(None),
              IRequest, interface.providedBy(None)), ILayout, name='test')
         self.assertIs(layout_factory.original, MyLayout)
+        self.assertFalse(layout_factory.cacheable)
+
+    @mock.patch('djed.layout.venusian')
+    def test_layout_decorator_cacheable(self, m_venusian):
+        from djed.layout import layout_config
+        from djed.layout import query_layout
+
+        vary = lambda context, request: None
+
+        @layout_config('test', cacheable=True, cache_vary=vary)
+        class MyLayout(View):
+            pass
+
+        wrp, cb = m_venusian.attach.call_args[0]
+        m_venusian.config.with_package.return_value = self.config
+        cb(m_venusian, 'test', MyLayout)
+
+        layout, context = query_layout(
+            object(), object(), self.request, 'test')
+        self.assertTrue(layout.cacheable)
+        self.assertIs(layout.vary, vary)
 
 
 class Context(object):
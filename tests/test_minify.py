@@ -0,0 +1,143 @@
+""" minification tests """
+from unittest import TestCase
+
+from djed.testing import BaseTestCase
+
+from djed.layout.minify import Minifier
+from djed.layout.minify import MinifyStage
+from djed.layout.minify import minify
+from djed.layout.minify import minify_stats
+
+HTML = (b'<html>\n  <body>\n\n    <p>a   b</p>\t<pre>\n  x  </pre>\n'
+        b'  <script type="text/javascript">\n  var a  = 1;\n</script >\n'
+        b'  <TEXTAREA>  t  </textarea>  <b>\xc3\xa9  \xc3\xa9</b>\n'
+        b'</body>\n</html>\n')
+
+MINIFIED = (b'<html>\n<body>\n<p>a b</p> <pre>\n  x  </pre>\n'
+            b'<script type="text/javascript">\n  var a  = 1;\n</script >\n'
+            b'<TEXTAREA>  t  </textarea> <b>\xc3\xa9 \xc3\xa9</b>\n'
+            b'</body>\n</html>\n')
+
+
+class TestMinifier(TestCase):
+
+    def test_minify(self):
+        data, raw = minify(HTML)
+        self.assertEqual(data, MINIFIED)
+        self.assertIsNone(raw)
+
+    def test_raw_state(self):
+        data, raw = minify(b'<div>  <pre class="a">  ')
+        self.assertEqual(data, b'<div> <pre class="a">  ')
+        self.assertEqual(raw, b'pre')
+
+        data, raw = minify(b'  </pre>  <b>', raw)
+        self.assertEqual(data, b'  </pre> <b>')
+        self.assertIsNone(raw)
+
+    def test_streaming(self):
+        for pos in range(len(HTML)):
+            minifier = Minifier()
+            data = (minifier.feed(HTML[:pos]) + minifier.feed(HTML[pos:]) +
+                    minifier.flush())
+            self.assertEqual(data, MINIFIED, pos)
+
+    def test_attributes(self):
+        data, raw = minify(
+            b'<input  value="a   b"\n  data-x=\'{"a":  [1,  2]}\'>  <b>')
+        self.assertEqual(
+            data, b'<input value="a   b"\ndata-x=\'{"a":  [1,  2]}\'> <b>')
+        self.assertIsNone(raw)
+
+        data, raw = minify(b'<pre title="a  >  b">  x  </pre>  ')
+        self.assertEqual(data, b'<pre title="a  >  b">  x  </pre> ')
+
+    def test_comments(self):
+        data, raw = minify(b'<!--  <pre>  -->  <p>  a  </p>  <!--x-->')
+        self.assertEqual(data, b'<!--  <pre>  --> <p> a </p> <!--x-->')
+        self.assertIsNone(raw)
+
+    def test_streaming_attributes(self):
+        html = (b'<div  class="a  b">  <!-- <pre> -- -->  <p>  x  </p>'
+                b'<input value=\'  \'>  <style>  a  </style>  ')
+        expected = minify(html)[0]
+        for pos in range(len(html)):
+            minifier = Minifier()
+            data = (minifier.feed(html[:pos]) + minifier.feed(html[pos:]) +
+                    minifier.flush())
+            self.assertEqual(data, expected, pos)
+
+    def test_stage(self):
+        stage = MinifyStage()
+
+        chunks = list(stage.chunks(
+            [b'<div>\n  <pre>', b'  <p> '], [b'  a  ', b'  </pre>  '],
+            [b'  </p>  ', b'\n </div>']))
+        self.assertEqual(
+            b''.join(chunks),
+            b'<div>\n<pre>  <p>   a    </pre>  </p> \n</div>')
+
+        list(stage.chunks([b'<div>\n  <pre>'], [], []))
+
+        stats = stage.stats()
+        self.assertEqual(stats['fragment_hits'], 1)
+        self.assertEqual(stats['fragment_misses'], 4)
+        self.assertGreater(stats['bytes_saved'], 0)
+        self.assertEqual(
+            stats['bytes_in'] - stats['bytes_out'], stats['bytes_saved'])
+
+
+    def test_stage_max_bytes(self):
+        stage = MinifyStage(max_bytes=100)
+
+        for idx in range(10):
+            stage.fragment(b'<p>  user %d  </p>' % idx + b' ' * 20)
+
+        stats = stage.fragments.stats()
+        self.assertLessEqual(stats['bytes'], 100)
+        self.assertGreater(stats['evictions'], 0)
+
+
+class TestMinifyLayout(BaseTestCase):
+
+    _includes = ('djed.layout', 'pyramid_chameleon')
+    _settings = {'djed.layout.minify': 'true'}
+
+    def test_tween(self):
+        self.config.add_layout('test', renderer='tests:test-layout-minify.pt')
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+        res = app.get('/view.html')
+        res2 = app.get('/view.html')
+
+        self.assertEqual(res.body, res2.body)
+        self.assertNotIn(b'\n\n', res.body)
+        self.assertNotIn(b'  ', res.body)
+        self.assertEqual(res.body, minify(res.body)[0])
+
+        stats = minify_stats(self.registry)
+        self.assertGreater(stats['bytes_saved'], 0)
+        self.assertGreater(stats['fragment_hits'], 0)
+
+    def test_tween_stream(self):
+        self.registry.settings['djed.layout.stream'] = True
+
+        self.config.add_layout('test', renderer='tests:test-layout-minify.pt')
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+        res = app.get('/view.html')
+        self.assertNotIn(b'  ', res.body)
+
+    def test_slot_segments(self):
+        self.config.add_layout(
+            'test', renderer='slot:tests:test-layout-slots.html')
+
+        from djed.layout import query_layout
+        layout, _ = query_layout(None, object(), self.request, 'test')
+        self.assertTrue(layout.renderer.minify)
+        self.assertEqual(
+            layout.renderer.template.segments[0], '<html><title>')
@@ -0,0 +1,126 @@
+""" static pre-rendering tests """
+import io
+import os
+import gzip
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from djed.testing import BaseTestCase
+
+from djed.layout.prerender import MANIFEST
+from djed.layout.prerender import main
+from djed.layout.prerender import output_path
+from djed.layout.prerender import prerender
+
+
+class TestPrerender(BaseTestCase):
+
+    _includes = ('djed.layout', 'pyramid_chameleon')
+    _settings = {'djed.layout.etag': 'true',
+                 'djed.layout.prerender_paths': '/view.html'}
+
+    def setUp(self):
+        super(TestPrerender, self).setUp()
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+        self.config.add_route('about', '/about')
+        self.config.add_view(
+            route_name='about', renderer='tests:view.pt', layout='test',
+            view=lambda request: {})
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestPrerender, self).tearDown()
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def test_output_path(self):
+        self.assertEqual(output_path('/'), 'index.html')
+        self.assertEqual(output_path('/about'), 'about/index.html')
+        self.assertEqual(output_path('/a/b/?x=1'), 'a/b/index.html')
+        self.assertEqual(output_path('/view.html'), 'view.html')
+
+    def test_prerender(self):
+        app = self.config.make_wsgi_app()
+
+        results = prerender(
+            app, ['/view.html', '/about', '/unknown'],
+            self.directory, compress=True)
+
+        self.assertEqual(
+            [(path, status) for path, status, _ in results],
+            [('/view.html', 'written'), ('/about', 'written'),
+             ('/unknown', 'error')])
+        self.assertEqual(
+            self._read('view.html').strip(), b'<div><h1>Test</h1></div>')
+        self.assertEqual(
+            gzip.decompress(self._read('view.html.gz')),
+            self._read('view.html'))
+        self.assertEqual(self._read('about/index.html'),
+                         self._read('view.html'))
+
+        manifest = json.loads(self._read(MANIFEST).decode('utf-8'))
+        self.assertEqual(sorted(manifest), ['/about', '/view.html'])
+        self.assertTrue(manifest['/view.html']['etag'])
+
+    def test_prerender_incremental(self):
+        app = self.config.make_wsgi_app()
+        prerender(app, ['/view.html', '/about'], self.directory)
+
+        results = prerender(app, ['/view.html', '/about'], self.directory)
+        self.assertEqual(
+            [(path, status) for path, status, _ in results],
+            [('/view.html', 'not-modified'), ('/about', 'not-modified')])
+
+        results = prerender(
+            app, ['/view.html'], self.directory, force=True)
+        self.assertEqual(results[0][1], 'written')
+
+        # entity tag changed, output is same
+        manifest = json.loads(self._read(MANIFEST).decode('utf-8'))
+        manifest['/view.html']['etag'] = '"changed"'
+        with open(os.path.join(self.directory, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+        results = prerender(app, ['/view.html'], self.directory)
+        self.assertEqual(results[0][1], 'unchanged')
+
+        os.unlink(os.path.join(self.directory, 'view.html'))
+        results = prerender(app, ['/view.html'], self.directory)
+        self.assertEqual(results[0][1], 'written')
+
+    def test_prerender_processes(self):
+        app = self.config.make_wsgi_app()
+
+        results = prerender(
+            app, ['/view.html', '/about'], self.directory, processes=2)
+
+        self.assertEqual([status for _, status, _ in results],
+                         ['written', 'written'])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, 'about/index.html')))
+
+    def test_main(self):
+        app = self.config.make_wsgi_app()
+        out = io.StringIO()
+
+        with mock.patch('djed.layout.prerender.get_app') as get_app, \
+                mock.patch('djed.layout.prerender.setup_logging'):
+            get_app.return_value = app
+            res = main(['prerender', 'app.ini', self.directory, '/',
+                        '--route', 'about', '--processes', '1'], out)
+
+        get_app.assert_called_with('app.ini', 'main')
+        self.assertEqual(res, 1)
+        self.assertEqual(
+            out.getvalue().split('\n'),
+            ['error /', 'written /about', 'written /view.html', ''])
@@ -0,0 +1,131 @@
+""" slot renderer tests """
+import os
+import shutil
+import tempfile
+from unittest import mock, TestCase
+from pyramid.exceptions import ConfigurationError
+
+from djed.testing import BaseTestCase
+
+from djed.layout import LayoutRenderer
+from djed.layout.slot import SlotRenderer
+from djed.layout.slot import SlotTemplate
+
+
+class Context(object):
+    def __init__(self, parent=None):
+        self.__parent__ = parent
+
+
+class Markup(str):
+    def __html__(self):
+        return self
+
+
+class TestSlotTemplate(TestCase):
+
+    def test_compile(self):
+        tmpl = SlotTemplate(
+            '<b>${title}</b>${ structure:cls }${content}!')
+
+        self.assertEqual(tmpl.segments, ['<b>', None, '</b>', None, '',
+                                         None, '!'])
+        self.assertEqual(tmpl.slots, [(1, 'title', False),
+                                      (3, 'cls', True),
+                                      (5, 'content', False)])
+
+    def test_render(self):
+        tmpl = SlotTemplate(
+            '<b>${title}</b><i>${structure:html}</i>${content}')
+
+        self.assertEqual(
+            tmpl.render({'title': '<1>', 'html': '<2>'}, '<p>3</p>'),
+            '<b>&lt;1&gt;</b><i><2></i><p>3</p>')
+        self.assertEqual(
+            tmpl.render({'title': Markup('<1>'), 'html': None}, ''),
+            '<b><1></b><i></i>')
+        self.assertEqual(
+            tmpl.render({'title': None, 'html': 5}, ''), '<b></b><i>5</i>')
+
+    def test_render_missing_name(self):
+        tmpl = SlotTemplate('${title}')
+        self.assertRaises(NameError, tmpl.render, {}, '')
+
+
+class TestSlotRenderer(BaseTestCase):
+
+    _includes = ('djed.layout', 'pyramid_chameleon')
+
+    def test_layout(self):
+        self.config.add_layout(
+            'test', renderer='slot:tests:test-layout-slots.html',
+            view=lambda context, request: {'title': 'A&B', 'cls': 'main'})
+
+        res = LayoutRenderer('test')('<p>View</p>', Context(), self.request)
+        self.assertEqual(
+            res, '<html><title>A&amp;B</title><body class="main">'
+            '<p>View</p></body></html>\n')
+
+    def test_layout_chain(self):
+        self.config.add_layout(
+            'test', parent='page', renderer='slot:tests:test-layout.html')
+        self.config.add_layout(
+            'page', renderer='tests:test-layout.pt')
+
+        rendr = LayoutRenderer('test')
+        res = rendr('View', Context(), self.request)
+        self.assertEqual(res, '<div><div>View</div>\n</div>\n')
+
+        chunks = rendr.render_chunks(b'View', Context(), self.request)
+        self.assertEqual(b''.join(chunks), res.encode('utf-8'))
+
+    def test_no_system_values(self):
+        self.config.add_layout(
+            'test', renderer='slot:tests:test-layout.html')
+
+        rendr = LayoutRenderer('test')
+        with mock.patch.object(SlotRenderer, 'render') as m:
+            res = rendr('View', Context(), self.request)
+            self.assertFalse(m.called)
+        self.assertEqual(res, '<div>View</div>\n')
+
+    def test_shared_renderer(self):
+        self.config.add_layout('l1', renderer='slot:tests:test-layout.html')
+        self.config.add_layout('l2', renderer='slot:tests:test-layout.html')
+
+        from djed.layout import query_layout
+        l1, _ = query_layout(None, Context(), self.request, 'l1')
+        l2, _ = query_layout(None, Context(), self.request, 'l2')
+        self.assertIsInstance(l1.renderer, SlotRenderer)
+        self.assertIs(l1.renderer, l2.renderer)
+
+    def test_missing_template(self):
+        self.assertRaises(
+            ConfigurationError, self.config.add_layout,
+            'test', renderer='slot:tests:unknown.html')
+
+    def test_reload_templates(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        path = os.path.join(directory, 'layout.html')
+        with open(path, 'w') as f:
+            f.write('<div>${content}</div>')
+
+        renderer = SlotRenderer(path)
+        self.assertEqual(
+            renderer.render({}, {'content': 'a'}, self.request),
+            '<div>a</div>')
+
+        with open(path, 'w') as f:
+            f.write('<p>${content}</p>')
+        os.utime(path, (renderer.mtime + 10, renderer.mtime + 10))
+
+        self.assertEqual(
+            renderer.render({}, {'content': 'a'}, self.request),
+            '<div>a</div>')
+
+        self.registry.settings['reload_templates'] = True
+        self.assertEqual(
+            renderer.render({}, {'content': 'a'}, self.request),
+            '<p>a</p>')
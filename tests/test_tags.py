@@ -0,0 +1,191 @@
+""" cache tags tests """
+from unittest import mock
+
+from djed.testing import BaseTestCase
+
+from djed.layout import LayoutRenderer
+from djed.layout.tags import root_tag
+
+
+class Context(object):
+    def __init__(self, parent=None):
+        self.__parent__ = parent
+
+
+class Root(object):
+    __parent__ = None
+    __name__ = 'site1'
+
+
+class TestCacheTags(BaseTestCase):
+
+    _includes = ('djed.layout', 'pyramid_chameleon')
+
+    def setUp(self):
+        super(TestCacheTags, self).setUp()
+
+        def menu(context, request):
+            request.set_layout_cache('menu', ttl=60)
+            return {}
+
+        self.config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True,
+            view=menu)
+        self.request.root = Root()
+
+    def _rendered(self):
+        rendr = LayoutRenderer('test')
+        with mock.patch.object(
+                rendr, 'render_layout',
+                wraps=rendr.render_layout) as m:
+            res = rendr('View', Context(), self.request)
+        self.assertEqual(res, '<div>View</div>\n')
+        return m.called
+
+    def test_default_settings(self):
+        self.assertIsNone(
+            self.registry.settings['djed.layout.cache_tags_backend'])
+
+    def test_set_layout_cache(self):
+        self.request.set_layout_cache('a', 'b', ttl=10)
+        self.request.set_layout_cache('c', ttl=20)
+
+        self.assertEqual(self.request._layout_cache_tags, {'a', 'b', 'c'})
+        self.assertEqual(self.request._layout_cache_ttl, 10)
+
+    def test_root_tag(self):
+        self.assertEqual(root_tag(Root()), 'root:tests.test_tags.Root:site1')
+
+    def test_invalidate_tag(self):
+        self.assertTrue(self._rendered())
+        self.assertFalse(self._rendered())
+
+        self.request.invalidate_layouts('other')
+        self.assertFalse(self._rendered())
+
+        self.request.invalidate_layouts('menu')
+        self.assertTrue(self._rendered())
+        self.assertFalse(self._rendered())
+
+    def test_invalidate_layout(self):
+        self.assertTrue(self._rendered())
+
+        self.request.invalidate_layouts(layout='other')
+        self.assertFalse(self._rendered())
+
+        self.request.invalidate_layouts(layout='test')
+        self.assertTrue(self._rendered())
+
+    def test_invalidate_root(self):
+        self.assertTrue(self._rendered())
+
+        other = Root()
+        other.__name__ = 'site2'
+        self.request.invalidate_layouts(root=other)
+        self.assertFalse(self._rendered())
+
+        self.request.invalidate_layouts(root=Root())
+        self.assertTrue(self._rendered())
+
+    def test_invalidate_directive(self):
+        self.assertTrue(self._rendered())
+
+        self.config.invalidate_layouts(tags=['menu'])
+        self.assertTrue(self._rendered())
+
+    def test_ttl(self):
+        with mock.patch('djed.layout.tags.time') as m_time:
+            m_time.time.return_value = 1000
+            self.assertTrue(self._rendered())
+
+            m_time.time.return_value = 1059
+            self.assertFalse(self._rendered())
+
+            m_time.time.return_value = 1061
+            self.assertTrue(self._rendered())
+
+    def test_evicted_tag_version(self):
+        from djed.layout.tags import tag_versions
+
+        self.assertTrue(self._rendered())
+
+        tag_versions(self.registry).clear()
+        self.assertTrue(self._rendered())
+        self.assertFalse(self._rendered())
+
+    def test_output_cache(self):
+        self.registry.settings['djed.layout.output_cache'] = True
+
+        self.config.add_view(
+            name='view.html', renderer='tests:view.pt', layout='test')
+
+        app = self.make_app()
+        app.get('/view.html')
+
+        with mock.patch.object(LayoutRenderer, 'render_chunks') as m:
+            app.get('/view.html')
+            self.assertFalse(m.called)
+
+        self.config.invalidate_layouts(layout='test')
+
+        with mock.patch.object(
+                LayoutRenderer, 'render_chunks',
+                return_value=[b'new']) as m:
+            res = app.get('/view.html')
+            self.assertTrue(m.called)
+        self.assertEqual(res.body, b'new')
+
+
+class TestSharedCacheTags(BaseTestCase):
+
+    _includes = ('djed.layout', 'pyramid_chameleon')
+
+    def _make_registry(self, directory):
+        from pyramid.config import Configurator
+
+        config = Configurator(settings={
+            'djed.layout.fragment_cache_backend':
+            'djed.layout.cache.file_cache_factory',
+            'djed.layout.fragment_cache_directory': directory})
+        config.include('djed.layout')
+        config.include('pyramid_chameleon')
+        config.add_layout(
+            'test', renderer='tests:test-layout.pt', cacheable=True)
+        config.commit()
+        return config.registry
+
+    def test_shared_versions(self):
+        import shutil
+        import tempfile
+        from djed.layout.cache import FileCache
+        from djed.layout.tags import tag_versions
+        from djed.layout.tags import invalidate_layouts
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        # two worker processes
+        registries = [self._make_registry(directory),
+                      self._make_registry(directory)]
+
+        versions = tag_versions(registries[0])
+        self.assertIsInstance(versions, FileCache)
+        self.assertTrue(versions.directory.startswith(directory))
+
+        rendr = LayoutRenderer('test')
+        with mock.patch.object(
+                rendr, 'render_layout',
+                wraps=rendr.render_layout) as m:
+            for idx in range(6):
+                request = self.make_request(registry=registries[idx % 2])
+                res = rendr('View', Context(), request)
+                self.assertEqual(res, '<div>View</div>\n')
+            self.assertEqual(m.call_count, 1)
+
+            invalidate_layouts(registries[0], layout='test')
+            rendr('View', Context(),
+                  self.make_request(registry=registries[1]))
+            self.assertEqual(m.call_count, 2)
+
+        stats = registries[0]._djed_layout_fragments.shared.stats()
+        self.assertEqual(stats['size'], 1)